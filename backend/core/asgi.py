@@ -18,11 +18,12 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import documents.routing
+from documents.middleware import CacheInvalidationListenerMiddleware
 
 # Максимально простая конфигурация ASGI
-application = ProtocolTypeRouter({
+application = CacheInvalidationListenerMiddleware(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": URLRouter(
         documents.routing.websocket_urlpatterns
     ),
-})
+}))
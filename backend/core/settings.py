@@ -58,6 +58,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     
     # Third-party apps
     'rest_framework',
@@ -188,6 +189,48 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Кэш: Redis, если задан REDIS_URL (общий для всех процессов), иначе память процесса.
+# locmem подходит только для одного процесса: версии документов в documents.cache
+# не будут согласованы между несколькими воркерами
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'rodnik',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'rodnik',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+
+# Время жизни закэшированных ответов retrieve (сек)
+DOCUMENTS_DETAIL_CACHE_TIMEOUT = 300
+
+# Максимальное количество документов в кэше объектов процесса (L1)
+DOCUMENTS_OBJECT_L1_SIZE = 1000
+
+# Буфер истории документов: интервал сброса (сек) и размер пачки bulk_create
+DOCUMENTS_ACTIVITY_FLUSH_INTERVAL = 2
+DOCUMENTS_ACTIVITY_BATCH_SIZE = 500
+
+# История хранит содержимое дельтами, полная версия - не реже чем раз в N версий
+DOCUMENTS_HISTORY_KEYFRAME_INTERVAL = 20
+
+# Время жизни сравнения версий истории в кэше (сек); версии не меняются
+DOCUMENTS_HISTORY_DIFF_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Уплотнение истории (compact_history): вся история хранится N дней,
+# затем версии остаются по одной в час, а после M дней - по одной в день
+DOCUMENTS_HISTORY_RETENTION_DAYS = 30
+DOCUMENTS_HISTORY_HOURLY_DAYS = 180
+
 
 
 # Auth settings
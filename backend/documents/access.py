@@ -0,0 +1,134 @@
+"""
+Эффективные права доступа к документам.
+
+Право AccessRight с include_children распространяется на все поддерево документа.
+Чтобы проверка не обходила предков на каждый запрос, права материализуются
+в таблицу EffectiveAccess: по строке на каждую пару (право, документ), на который
+оно действует. Проверка доступа - один поиск по индексу (user, document).
+
+Таблица поддерживается при изменениях:
+- выдача и изменение права пересчитывают его строки (sync_access_right);
+- отзыв права и удаление документа удаляют строки каскадно;
+- создание и перемещение документов пересчитывают унаследованные строки
+  перенесенного поддерева (refresh_subtree_access).
+Строки прав, выданных внутри поддерева, при перемещении остаются верными:
+относительная структура поддерева не меняется.
+"""
+from django.db import connection
+from django.db.models import Q, Exists, OuterRef
+from .models import Document, AccessRight, EffectiveAccess
+
+# Все документы, на которые действуют права: сам документ и, при include_children, его поддерево.
+# Границы поддерева берутся из текущих полей MPTT документа права
+_CLOSURE_SQL = """
+    INSERT INTO {effective} (access_right_id, user_id, document_id, role)
+    SELECT ar.id, ar.user_id, d.id, ar.role
+    FROM {access} ar
+    JOIN {document} src ON src.id = ar.document_id
+    JOIN {document} d ON d.tree_id = src.tree_id
+        AND d.lft BETWEEN src.lft AND (CASE WHEN ar.include_children THEN src.rght ELSE src.lft END)
+    WHERE {condition}
+    ON CONFLICT (access_right_id, document_id) DO NOTHING
+"""
+
+
+def _execute_closure(condition, params, document_range=None):
+    """
+    Вставляет строки прав, отобранных условием condition (по псевдониму ar).
+    document_range=(tree_id, lft, rght) ограничивает вставку одним поддеревом
+    """
+    if document_range is not None:
+        condition = f"({condition}) AND d.tree_id = %s AND d.lft BETWEEN %s AND %s"
+        params = [*params, *document_range]
+
+    sql = _CLOSURE_SQL.format(
+        effective=EffectiveAccess._meta.db_table,
+        access=AccessRight._meta.db_table,
+        document=Document._meta.db_table,
+        condition=condition,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def sync_access_right(access_right):
+    """
+    Пересчитывает строки одного права после его выдачи или изменения
+    (роль, include_children)
+    """
+    EffectiveAccess.objects.filter(access_right=access_right).delete()
+    _execute_closure('ar.id = %s', [access_right.pk])
+
+
+def refresh_subtree_access(document):
+    """
+    Пересчитывает права поддерева document, унаследованные от предков, после
+    создания или перемещения. Поля MPTT документа должны быть актуальны;
+    вызывать в транзакции под блокировкой дерева
+    """
+    subtree = Q(
+        document__tree_id=document.tree_id,
+        document__lft__gte=document.lft,
+        document__lft__lte=document.rght,
+    )
+    inside = Q(
+        access_right__document__tree_id=document.tree_id,
+        access_right__document__lft__gte=document.lft,
+        access_right__document__lft__lte=document.rght,
+    )
+    # Права, полученные от прежних предков
+    EffectiveAccess.objects.filter(subtree).exclude(inside).delete()
+
+    # Права новых предков, действующие на потомков
+    _execute_closure(
+        'ar.include_children AND src.tree_id = %s AND src.lft < %s AND src.rght > %s',
+        [document.tree_id, document.lft, document.rght],
+        document_range=(document.tree_id, document.lft, document.rght),
+    )
+
+
+def rebuild_effective_access():
+    """
+    Полностью пересобирает таблицу эффективных прав из AccessRight
+    """
+    EffectiveAccess.objects.all().delete()
+    _execute_closure('TRUE', [])
+
+
+def has_role(user, document, roles):
+    """
+    Проверяет, есть ли у пользователя одна из ролей roles на документ (без учета владения)
+    """
+    return EffectiveAccess.objects.filter(user_id=user.pk, document_id=document.pk, role__in=roles).exists()
+
+
+def can_view(user, document):
+    """
+    Владелец или любое действующее право
+    """
+    return document.owner_id == user.pk or EffectiveAccess.objects.filter(
+        user_id=user.pk, document_id=document.pk
+    ).exists()
+
+
+def resolve_documents(user, document_ids, roles=None):
+    """
+    Из переданных ID выбирает одним запросом документы, доступные пользователю:
+    собственные и с правом (одной из ролей roles, если они заданы).
+    Возвращает множество ID
+    """
+    rights = EffectiveAccess.objects.filter(user_id=user.pk, document_id=OuterRef('pk'))
+    if roles is not None:
+        rights = rights.filter(role__in=roles)
+    return set(
+        Document.objects.filter(pk__in=document_ids)
+        .filter(Q(owner_id=user.pk) | Exists(rights))
+        .values_list('id', flat=True)
+    )
+
+
+def editable_documents(user, document_ids):
+    """
+    Какие из документов пользователь может редактировать
+    """
+    return resolve_documents(user, document_ids, roles=[AccessRight.EDITOR])
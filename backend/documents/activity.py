@@ -0,0 +1,186 @@
+"""
+Буферизованная запись истории документов (просмотры и редактирования).
+
+Обработчики запросов не пишут DocumentHistory синхронно: событие кладется
+в буфер процесса, а фоновый поток сбрасывает буфер пачками через bulk_create
+раз в ACTIVITY_FLUSH_INTERVAL секунд или при накоплении ACTIVITY_BATCH_SIZE
+событий. Время события фиксируется при постановке в буфер.
+
+Окно повторов ("не записывать просмотр чаще раза в 30 минут", "редактирование -
+раз в 5 минут") хранится отметками в кэше, без запроса последней записи к БД.
+
+События в буфере теряются при аварийном завершении процесса (при обычном
+завершении буфер сбрасывается). Для журнала активности это допустимо: версия
+содержимого становится базой дельт только после подтвержденной записи, поэтому
+потеря записи из буфера не ломает восстановление остальных версий.
+"""
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import DocumentHistory
+from .history import encode_version, confirm_version, is_version_entry
+from .partitions import ensure_partitions, month_start
+
+logger = logging.getLogger(__name__)
+
+# Интервал сброса буфера (сек), размер пачки и предел буфера
+ACTIVITY_FLUSH_INTERVAL = getattr(settings, 'DOCUMENTS_ACTIVITY_FLUSH_INTERVAL', 2)
+ACTIVITY_BATCH_SIZE = getattr(settings, 'DOCUMENTS_ACTIVITY_BATCH_SIZE', 500)
+ACTIVITY_MAX_BUFFER = getattr(settings, 'DOCUMENTS_ACTIVITY_MAX_BUFFER', 10000)
+
+# Окна повторов (сек): повторные события пользователя по документу не записываются
+VIEW_DEDUPE_SECONDS = 30 * 60
+EDIT_DEDUPE_SECONDS = 5 * 60
+
+
+class ActivityBuffer:
+    """
+    Потокобезопасный буфер записей истории с фоновым сбросом
+    """
+
+    def __init__(self, flush_interval, batch_size, max_size):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self._entries = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._partitions_month = None
+
+    def enqueue(self, entry):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # БД не успевает: отбрасываем самое старое событие, а не блокируем запрос.
+                # Версия становится базой дельт только после записи в БД, поэтому
+                # потеря версии из буфера не ломает цепочки - следующая будет опорной
+                self._entries.pop(0)
+                logger.warning("Буфер истории документов переполнен, событие отброшено")
+            self._entries.append(entry)
+            size = len(self._entries)
+            self._ensure_thread()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Записывает накопленные события пачками. Возвращает количество записанных
+        """
+        with self._flush_lock:
+            with self._lock:
+                entries, self._entries = self._entries, []
+            written = 0
+            for start in range(0, len(entries), self.batch_size):
+                batch = entries[start:start + self.batch_size]
+                try:
+                    DocumentHistory.objects.bulk_create(batch)
+                    saved = batch
+                except Exception as e:
+                    # Например, документ успели удалить: пишем пачку по одной записи
+                    logger.error(f"Ошибка пакетной записи истории документов: {str(e)}")
+                    saved = []
+                    for entry in batch:
+                        try:
+                            entry.save()
+                            saved.append(entry)
+                        except Exception as e:
+                            logger.error(f"Запись истории документа {entry.document_id} пропущена: {str(e)}")
+                # Только сохраненные версии могут стать базой следующих дельт
+                for entry in saved:
+                    if is_version_entry(entry):
+                        confirm_version(entry.document_id, entry.id)
+                written += len(saved)
+            return written
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='documents-activity', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self._ensure_partitions()
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _ensure_partitions(self):
+        """
+        Раз в месяц на процесс создает секции истории на следующие месяцы
+        """
+        month = month_start(timezone.now())
+        if self._partitions_month == month:
+            return
+        try:
+            ensure_partitions()
+            self._partitions_month = month
+        except Exception as e:
+            # Строки попадут в секцию по умолчанию и будут перенесены позже
+            logger.error(f"Не удалось создать секции истории документов: {str(e)}")
+
+
+activity_buffer = ActivityBuffer(ACTIVITY_FLUSH_INTERVAL, ACTIVITY_BATCH_SIZE, ACTIVITY_MAX_BUFFER)
+atexit.register(activity_buffer.flush)
+
+
+def _first_in_window(kind, document_id, user_id, seconds):
+    """
+    True, если это первое событие пользователя по документу в окне повторов
+    (add не перезапишет отметку, поставленную параллельным запросом)
+    """
+    return cache.add(f"documents:{kind}:{document_id}:{user_id}", True, seconds)
+
+
+def record_activity(document, user, action_type, changes, entry_id=None):
+    """
+    Ставит запись истории в буфер
+    """
+    activity_buffer.enqueue(DocumentHistory(
+        id=entry_id,
+        document_id=document.pk,
+        user_id=user.pk,
+        action_type=action_type,
+        changes=changes,
+        created_at=timezone.now(),
+    ))
+
+
+def record_view(document, user):
+    """
+    Просмотр документа; повторные просмотры в течение 30 минут не записываются.
+    Возвращает True, если событие поставлено в буфер
+    """
+    if not _first_in_window('viewed', document.pk, user.pk, VIEW_DEDUPE_SECONDS):
+        return False
+    record_activity(document, user, DocumentHistory.ACTION_VIEW, {
+        'user_id': user.id,
+        'username': user.username
+    })
+    return True
+
+
+def record_edit(document, user, action_type, content):
+    """
+    Изменение содержимого или заголовка. Обычные редактирования одного пользователя
+    записываются не чаще раза в 5 минут. Содержимое хранится дельтой к предыдущей
+    записанной версии (см. documents.history). Возвращает True, если событие поставлено в буфер
+    """
+    if action_type == DocumentHistory.ACTION_EDIT and not _first_in_window('edited', document.pk, user.pk, EDIT_DEDUPE_SECONDS):
+        return False
+    entry_id, version = encode_version(document.pk, content)
+    record_activity(document, user, action_type, {
+        **version,
+        'user_id': user.id,
+        'username': user.username,
+        'action': action_type
+    }, entry_id=entry_id)
+    return True
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, AccessRight, DocumentHistory
+from .models import Document, AccessRight, DocumentHistory, DocumentActivityCounter
 from mptt.admin import MPTTModelAdmin, DraggableMPTTAdmin
 import json
 from django.utils.html import format_html
@@ -33,36 +33,24 @@ class DocumentAdmin(DraggableMPTTAdmin):
     indented_title.short_description = 'Title'
     
     def debug_info(self, instance):
-        """Базовая отладочная информация о поле content"""
+        """Базовая отладочная информация о содержимом (по производным полям, без разбора JSON)"""
         try:
-            content_data = instance.content
             debug_text = []
             
-            # Тип данных
-            debug_text.append(f"Тип данных: {type(content_data).__name__}")
+            block_count = sum(instance.block_types.values())
+            if block_count == 0:
+                debug_text.append("Значение: пустой документ (нет блоков)")
+            else:
+                debug_text.append(f"Количество блоков: {block_count}")
+                for block_type, count in sorted(instance.block_types.items(), key=lambda item: -item[1]):
+                    debug_text.append(f"  - {block_type}: {count}")
             
-            # Проверка на пустоту
-            is_empty = False
-            if content_data is None:
-                is_empty = True
-                debug_text.append("Значение: None")
-            elif isinstance(content_data, dict) and not content_data:
-                is_empty = True
-                debug_text.append("Значение: пустой словарь {}")
-            
-            # Информация о размере и структуре
-            if not is_empty and isinstance(content_data, dict):
-                debug_text.append(f"Ключи в словаре: {', '.join(content_data.keys())}")
-                if 'blocks' in content_data:
-                    blocks = content_data.get('blocks', [])
-                    debug_text.append(f"Количество блоков: {len(blocks)}")
-                    if blocks:
-                        # Показываем информацию о первых 3 блоках
-                        for i, block in enumerate(blocks[:3]):
-                            if i >= 3:
-                                break
-                            block_type = block.get('type', 'неизвестный')
-                            debug_text.append(f"  - Блок #{i+1}: {block_type}")
+            debug_text.append(f"Количество слов: {instance.word_count}")
+            debug_text.append(f"Задач: {instance.tasks_count}, выполнено: {instance.completed_tasks_count}")
+            for heading in instance.outline:
+                indent = '  ' * max((heading.get('level') or 1) - 1, 0)
+                debug_text.append(f"{indent}# {heading.get('text')}")
+            debug_text.append(f"Хэш содержимого: {instance.content_hash or 'не вычислен'}")
             
             return "\n".join(debug_text)
         except Exception as e:
@@ -105,7 +93,14 @@ class DocumentHistoryAdmin(admin.ModelAdmin):
     search_fields = ['document__title', 'user__username', 'user__email']
     raw_id_fields = ['document', 'user']
 
+class DocumentActivityCounterAdmin(admin.ModelAdmin):
+    list_display = ['id', 'document', 'date', 'action_type', 'count']
+    list_filter = ['action_type', 'date']
+    search_fields = ['document__title']
+    raw_id_fields = ['document']
+
 # Регистрируем модели для админки
 admin.site.register(Document, DocumentAdmin)
 admin.site.register(AccessRight, AccessRightAdmin)
 admin.site.register(DocumentHistory, DocumentHistoryAdmin)
+admin.site.register(DocumentActivityCounter, DocumentActivityCounterAdmin)
@@ -0,0 +1,292 @@
+"""
+Кэширование документов.
+
+Версии - случайные токены в общем кэше, их сброс делает старые записи недостижимыми:
+- версия документа меняется при изменении содержимого и прав доступа;
+- версия дерева (tree_id) - при изменении заголовков, избранного и структуры
+  (создание, перемещение, удаление детей), от которых зависят path и children.
+
+На версиях построены два кэша:
+- сериализованные ответы retrieve по ключу (документ, версии, параметры запроса);
+- объекты Document в два уровня: L1 - ограниченный LRU в памяти процесса,
+  L2 - общий кэш. При сбросе версий процесс сразу очищает свой L1 и рассылает
+  сообщение через слой каналов, по которому остальные процессы очищают свои.
+
+Бэкенд - кэш Django по умолчанию: Redis при заданном REDIS_URL, иначе locmem
+(только для одного процесса, например при разработке).
+"""
+import asyncio
+import hashlib
+import logging
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlencode
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+# Время жизни закэшированного ответа и токенов версий (сек)
+DETAIL_CACHE_TIMEOUT = getattr(settings, 'DOCUMENTS_DETAIL_CACHE_TIMEOUT', 300)
+VERSION_TIMEOUT = 7 * 24 * 60 * 60
+
+# Объекты документов: размер и время жизни L1 в процессе, время жизни в L2 (сек).
+# Короткие сроки ограничивают устаревание, если сообщение о сбросе потеряно
+OBJECT_L1_SIZE = getattr(settings, 'DOCUMENTS_OBJECT_L1_SIZE', 1000)
+OBJECT_L1_TIMEOUT = 30
+OBJECT_L2_TIMEOUT = 120
+
+# Группа слоя каналов для рассылки сбросов L1 между процессами
+INVALIDATION_GROUP = 'documents-cache-invalidation'
+
+# Как часто слушатель продлевает членство в группе (channels-redis удаляет его через сутки)
+INVALIDATION_GROUP_REFRESH = 60 * 60
+
+
+def _document_version_key(document_id):
+    return f"documents:version:{document_id}"
+
+
+def _tree_version_key(tree_id):
+    return f"documents:tree-version:{tree_id}"
+
+
+def _get_tokens(keys):
+    """
+    Токены по ключам; отсутствующие создаются
+    (add не перезапишет токен, созданный параллельно другим процессом)
+    """
+    tokens = cache.get_many(keys)
+    missing = [key for key in keys if key not in tokens]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, VERSION_TIMEOUT)
+        tokens.update(cache.get_many(missing))
+    return tuple(tokens.get(key) for key in keys)
+
+
+def get_versions(document):
+    """
+    Токены версий документа и его дерева
+    """
+    return _get_tokens([_document_version_key(document.pk), _tree_version_key(document.tree_id)])
+
+
+class LocalLRUCache:
+    """
+    Ограниченный LRU-кэш процесса с временем жизни записей.
+    Значения хранятся вместе с tree_id, чтобы сбрасывать их по дереву
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, _tree_id, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, tree_id, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, tree_id, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, keys=(), tree_ids=()):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            if tree_ids:
+                tree_ids = set(tree_ids)
+                for key in [key for key, entry in self._entries.items() if entry[1] in tree_ids]:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_documents = LocalLRUCache(OBJECT_L1_SIZE, OBJECT_L1_TIMEOUT)
+
+
+def apply_invalidation(message):
+    """
+    Очищает L1 процесса по сообщению о сбросе {documents, trees}
+    """
+    local_documents.evict(message.get('documents', ()), message.get('trees', ()))
+
+
+def _broadcast(message):
+    """
+    Рассылает сброс остальным процессам. Ошибка рассылки не прерывает запись:
+    устаревшие записи L1 истекут сами через OBJECT_L1_TIMEOUT
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(INVALIDATION_GROUP, {
+            'type': 'documents.invalidate',
+            **message,
+        })
+    except Exception as e:
+        logger.error(f"Не удалось разослать сброс кэша документов: {str(e)}")
+
+
+def _invalidate_on_commit(keys, message):
+    """
+    Сбрасывает токены и L1 после фиксации транзакции: иначе параллельный запрос
+    может закэшировать еще старые данные под новой версией
+    """
+    def invalidate():
+        cache.delete_many(keys)
+        apply_invalidation(message)
+        _broadcast(message)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_documents(*document_ids):
+    """
+    Сбрасывает версии документов (содержимое, права доступа)
+    """
+    document_ids = [pk for pk in document_ids if pk is not None]
+    if document_ids:
+        _invalidate_on_commit(
+            [_document_version_key(pk) for pk in document_ids],
+            {'documents': document_ids}
+        )
+
+
+def invalidate_trees(*tree_ids):
+    """
+    Сбрасывает версии деревьев (заголовки, избранное, структура)
+    """
+    tree_ids = list({tree_id for tree_id in tree_ids if tree_id is not None})
+    if tree_ids:
+        _invalidate_on_commit(
+            [_tree_version_key(tree_id) for tree_id in tree_ids],
+            {'trees': tree_ids}
+        )
+
+
+def detail_cache_key(document, versions, request):
+    """
+    Ключ ответа: документ, версии и параметры запроса (fields/omit меняют ответ)
+    """
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    params = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return f"documents:detail:{document.pk}:{':'.join(versions)}:{params}"
+
+
+def get_cached_detail(key):
+    return cache.get(key)
+
+
+def set_cached_detail(key, data):
+    cache.set(key, data, DETAIL_CACHE_TIMEOUT)
+
+
+def _object_key(document_id, document_version):
+    return f"documents:object:{document_id}:{document_version}"
+
+
+def get_document(document_id):
+    """
+    Документ по ID через L1 -> L2 -> БД. Каждый вызов возвращает отдельную копию,
+    которую можно изменять и сохранять (с update_fields). Если документа нет,
+    выбрасывает Document.DoesNotExist.
+
+    Записи L1 и L2 хранят токены версий документа и дерева и отбрасываются,
+    если хотя бы один из них с тех пор изменился. Токены читаются до запроса к БД
+    и проверяются после него: если запись зафиксирована во время чтения,
+    прочитанный документ не кэшируется
+    """
+    try:
+        document_id = int(document_id)
+    except (TypeError, ValueError):
+        raise Document.DoesNotExist(f"Некорректный ID документа: {document_id!r}")
+
+    document_key = _document_version_key(document_id)
+
+    local = local_documents.get(document_id)
+    if local is not None:
+        document_version, tree_id, tree_version, data = local
+        # Копия могла попасть в L1 после сброса по сообщению, поэтому токены сверяются всегда
+        if _get_tokens([document_key, _tree_version_key(tree_id)]) == (document_version, tree_version):
+            return pickle.loads(data)
+
+    document_version = _get_tokens([document_key])[0]
+    key = _object_key(document_id, document_version)
+
+    entry = cache.get(key)
+    if entry is not None:
+        tree_id, tree_version, data = entry
+        if _get_tokens([_tree_version_key(tree_id)])[0] == tree_version:
+            local_documents.set(document_id, tree_id, (document_version, tree_id, tree_version, data))
+            return pickle.loads(data)
+    else:
+        tree_id = Document.objects.filter(pk=document_id).values_list('tree_id', flat=True).first()
+        if tree_id is None:
+            raise Document.DoesNotExist(f"Документ {document_id} не найден")
+
+    tree_key = _tree_version_key(tree_id)
+    tree_version = _get_tokens([tree_key])[0]
+    document = Document.objects.get(pk=document_id)
+
+    if document.tree_id == tree_id and _get_tokens([document_key, tree_key]) == (document_version, tree_version):
+        data = pickle.dumps(document)
+        cache.set(key, (tree_id, tree_version, data), OBJECT_L2_TIMEOUT)
+        local_documents.set(document_id, tree_id, (document_version, tree_id, tree_version, data))
+    return document
+
+
+async def listen_for_invalidations():
+    """
+    Слушает рассылку сбросов кэша и очищает L1 текущего процесса.
+    Запускается один раз на процесс (см. documents.middleware)
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    channel = await channel_layer.new_channel()
+    while True:
+        try:
+            await channel_layer.group_add(INVALIDATION_GROUP, channel)
+            deadline = time.monotonic() + INVALIDATION_GROUP_REFRESH
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(
+                        channel_layer.receive(channel),
+                        timeout=max(deadline - time.monotonic(), 1)
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if message.get('type') == 'documents.invalidate':
+                    apply_invalidation(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Слой каналов недоступен: чистим L1 целиком и пробуем снова
+            logger.error(f"Ошибка слушателя сброса кэша документов: {str(e)}")
+            local_documents.clear()
+            await asyncio.sleep(1)
@@ -0,0 +1,67 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для документов.
+
+Вместо сериализации ответа сначала вычисляется "отпечаток" строк, от которых
+зависит ответ: одним агрегатом по узким колонкам (количество, максимальный
+updated_at и суммы id/lft/rght). Любое изменение заголовка, содержимого,
+избранного, структуры дерева или корзины меняет отпечаток. Если ETag клиента
+совпадает, возвращается 304 без загрузки содержимого и сериализации.
+"""
+import hashlib
+import json
+from django.db.models import Count, Max, Sum, F
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def fingerprint(queryset):
+    """
+    Агрегированное состояние набора документов для проверки актуальности ответа
+    """
+    return queryset.order_by().aggregate(
+        count=Count('id'),
+        last_modified=Max('updated_at'),
+        ids=Sum('id'),
+        lft=Sum('lft'),
+        span=Sum(F('rght') - F('lft')),
+    )
+
+
+def make_etag(request, *parts):
+    """
+    Сильный ETag из пользователя, полного пути запроса (параметры влияют на ответ)
+    и переданных частей состояния
+    """
+    data = json.dumps([request.user.pk, request.get_full_path(), *parts], default=str, sort_keys=True)
+    return '"%s"' % hashlib.sha1(data.encode()).hexdigest()
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Проставляет валидаторы и требует от клиента перепроверки перед использованием копии
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional_response(request, state, build_response, *parts):
+    """
+    Возвращает 304, если ответ по состоянию state не изменился у клиента,
+    иначе строит ответ через build_response() и добавляет к нему валидаторы.
+    If-None-Match имеет приоритет над If-Modified-Since
+    """
+    etag = make_etag(request, state, *parts)
+    last_modified = state.get('last_modified')
+
+    not_modified = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if not_modified is not None:
+        return set_validators(not_modified, etag, last_modified)
+
+    return set_validators(build_response(), etag, last_modified)
@@ -3,6 +3,10 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import Document, DocumentHistory
+from .derived import update_derived_content
+from .cache import invalidate_documents, get_document
+from .access import can_view
+from .activity import record_edit
 from django.contrib.auth import get_user_model
 # Удаляем неправильный импорт
 # from django.http.request import parse_cookie
@@ -349,15 +353,11 @@ class DocumentConsumer(AsyncWebsocketConsumer):
     def has_access_to_document(self, user_id, document_id):
         """Проверяет, имеет ли пользователь доступ к документу"""
         try:
-            document = Document.objects.get(id=document_id)
+            document = get_document(document_id)
             user = User.objects.get(id=user_id)
             
-            # Проверка на владельца документа
-            if document.owner_id == user_id:
-                return True
-                
-            # Проверка на доступ через права доступа
-            return document.access_rights.filter(user=user).exists()
+            # Владелец или право на документ, в том числе унаследованное
+            return can_view(user, document)
         except (Document.DoesNotExist, User.DoesNotExist) as e:
             logger.error(f"Ошибка проверки доступа: {str(e)}")
             return False
@@ -386,43 +386,17 @@ class DocumentConsumer(AsyncWebsocketConsumer):
             
             # Обновляем содержимое документа
             document.content = content
-            document.save()
-            
-            # Проверяем, нужно ли записывать это в историю
-            should_record = True
-            
-            # Для обычного редактирования делаем ограничение по времени
-            if action_type == DocumentHistory.ACTION_EDIT:
-                # Не записываем повторные редактирования от того же пользователя с интервалом менее 5 минут
-                from django.utils import timezone
-                last_edit = DocumentHistory.objects.filter(
-                    document=document, 
-                    user=user,
-                    action_type=DocumentHistory.ACTION_EDIT
-                ).order_by('-created_at').first()
-                
-                if last_edit:
-                    # Проверяем, прошло ли 5 минут с момента последнего редактирования
-                    time_diff = timezone.now() - last_edit.created_at
-                    if time_diff.total_seconds() < 300:  # 5 минут в секундах
-                        should_record = False
-                        logger.info(f"Пропускаем запись редактирования в WebSocket, прошло меньше 5 минут с последнего")
-            
-            # Если нужно записать в историю
-            if should_record:
-                # Создаем запись в истории изменений
-                DocumentHistory.objects.create(
-                    document=document,
-                    user=user,
-                    action_type=action_type,
-                    changes={
-                        'content': content,
-                        'user_id': user.id,
-                        'username': user.username,
-                        'action': action_type
-                    }
-                )
+            document.save(update_fields=['content', 'updated_at'])
+            update_derived_content(document)
+            # Родитель показывает updated_at документа в children
+            invalidate_documents(document.pk, document.parent_id)
+            
+            # Запись истории ставится в буфер; повторные редактирования того же
+            # пользователя в течение 5 минут не записываются
+            if record_edit(document, user, action_type, content):
                 logger.info(f"Записано действие {action_type} в историю через WebSocket")
+            else:
+                logger.info("Пропускаем запись редактирования в WebSocket, прошло меньше 5 минут с последнего")
             
             logger.info(f"Документ {self.document_id} успешно обновлен пользователем {user.username}")
             return True
@@ -0,0 +1,193 @@
+"""
+Вспомогательные функции для работы с содержимым документов в формате EditorJS
+"""
+import copy
+import hashlib
+import html
+import json
+import re
+
+# Типы блоков со ссылкой на вложенный документ (data.id).
+# Редактор сохраняет nestedDocument, старые документы содержат nested-document
+NESTED_DOCUMENT_BLOCK_TYPES = ('nestedDocument', 'nested-document')
+
+# Служебные ключи данных блоков, не содержащие текста для поиска
+NON_TEXT_KEYS = {
+    'id', 'style', 'level', 'alignment', 'url', 'link', 'file', 'checked', 'is_completed',
+    'withBorder', 'withBackground', 'stretched', 'meta', 'counterType', 'start',
+}
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+WORD_RE = re.compile(r'\w+')
+
+# Признаки отмеченного элемента чек-листа в разметке EditorJS
+CHECKED_MARKERS = ('cdx-list__checkbox--checked', 'checked="true"', '"checked": true', '"checked":true')
+
+
+def get_blocks(content):
+    """
+    Возвращает список блоков EditorJS (пустой список для некорректного содержимого)
+    """
+    if not isinstance(content, dict):
+        return []
+    blocks = content.get('blocks')
+    return blocks if isinstance(blocks, list) else []
+
+
+def remap_nested_documents(content, id_map):
+    """
+    Возвращает копию содержимого, в которой ссылки на вложенные документы
+    заменены по словарю id_map {старый ID: новый ID}. Тип значения ID сохраняется
+    """
+    content = copy.deepcopy(content)
+
+    for block in get_blocks(content):
+        if not isinstance(block, dict) or block.get('type') not in NESTED_DOCUMENT_BLOCK_TYPES:
+            continue
+
+        data = block.get('data')
+        if not isinstance(data, dict) or data.get('id') is None:
+            continue
+
+        new_id = id_map.get(str(data['id']))
+        if new_id is not None:
+            data['id'] = str(new_id) if isinstance(data['id'], str) else new_id
+
+    return content
+
+
+def strip_html(value):
+    """
+    Убирает HTML-разметку EditorJS и лишние пробелы из строки
+    """
+    text = html.unescape(HTML_TAG_RE.sub(' ', value))
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _collect_text(value, parts):
+    """
+    Рекурсивно собирает текстовые значения из данных блока
+    """
+    if isinstance(value, str):
+        text = strip_html(value)
+        if text:
+            parts.append(text)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_text(item, parts)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key not in NON_TEXT_KEYS:
+                _collect_text(item, parts)
+
+
+def get_block_text(block):
+    """
+    Простой текст одного блока (все текстовые значения его данных через пробел)
+    """
+    parts = []
+    _collect_text(block.get('data'), parts)
+    return ' '.join(parts)
+
+
+def extract_plain_text(content):
+    """
+    Извлекает простой текст из блоков EditorJS: по строке на блок, без HTML-разметки
+    """
+    lines = []
+    for block in get_blocks(content):
+        if not isinstance(block, dict):
+            continue
+        text = get_block_text(block)
+        if text:
+            lines.append(text)
+    return '\n'.join(lines)
+
+
+def hash_content(content):
+    """
+    SHA-256 блоков документа. Метка времени сохранения EditorJS (time) не учитывается,
+    поэтому повторное сохранение без правок дает тот же хэш
+    """
+    data = json.dumps(get_blocks(content), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def is_item_checked(item):
+    """
+    Проверяет, отмечен ли элемент чек-листа (флаг checked, meta.checked или HTML-класс)
+    """
+    if isinstance(item, dict):
+        if item.get('checked') is True or str(item.get('checked')).lower() == 'true':
+            return True
+        item = json.dumps(item, ensure_ascii=False)
+    return isinstance(item, str) and any(marker in item for marker in CHECKED_MARKERS)
+
+
+def count_tasks(block):
+    """
+    Возвращает (всего задач, выполнено) для блока: элементы чек-листов и блоки task
+    """
+    block_type = block.get('type')
+    data = block.get('data')
+    if not isinstance(data, dict):
+        return 0, 0
+    
+    if block_type == 'checklist' or (block_type == 'list' and data.get('style') == 'checklist'):
+        items = data.get('items')
+        if not isinstance(items, list):
+            return 0, 0
+        return len(items), sum(1 for item in items if is_item_checked(item))
+    
+    if block_type == 'task':
+        return 1, 1 if data.get('is_completed') else 0
+    
+    return 0, 0
+
+
+def derive_content(content):
+    """
+    Вычисляет производные поля документа за один проход по блокам:
+    простой текст, количество слов, оглавление, гистограмму типов блоков,
+    счетчики задач и хэш содержимого. Ключи совпадают с полями Document
+    """
+    lines = []
+    outline = []
+    block_types = {}
+    tasks_count = 0
+    completed_tasks_count = 0
+    
+    for block in get_blocks(content):
+        if not isinstance(block, dict):
+            continue
+        
+        block_type = str(block.get('type') or 'unknown')
+        block_types[block_type] = block_types.get(block_type, 0) + 1
+        
+        text = get_block_text(block)
+        if text:
+            lines.append(text)
+        
+        if block_type == 'header':
+            data = block.get('data') or {}
+            outline.append({
+                'id': block.get('id'),
+                'level': data.get('level'),
+                'text': text,
+            })
+        
+        total, completed = count_tasks(block)
+        tasks_count += total
+        completed_tasks_count += completed
+    
+    plain_text = '\n'.join(lines)
+    return {
+        'plain_text': plain_text,
+        'word_count': len(WORD_RE.findall(plain_text)),
+        'outline': outline,
+        'block_types': block_types,
+        'tasks_count': tasks_count,
+        'completed_tasks_count': completed_tasks_count,
+        'content_hash': hash_content(content),
+    }
@@ -0,0 +1,32 @@
+"""
+Пересчет производных полей документа после записи содержимого.
+
+Содержимое разбирается один раз при изменении (content.derive_content), результат
+сохраняется в колонки Document вместе с поисковым вектором. Поиск, статистика
+и админка читают готовые колонки.
+"""
+from django.db.models import Value
+from .models import Document
+from .content import derive_content, hash_content
+from .search import document_search_vector
+
+
+def update_derived_content(document, title_changed=False):
+    """
+    Пересчитывает производные поля и поисковый вектор документа одним UPDATE.
+    Если блоки не изменились (совпал хэш) и заголовок тот же, запись пропускается.
+    Возвращает True, если поля были обновлены
+    """
+    if not title_changed and document.content_hash and hash_content(document.content) == document.content_hash:
+        return False
+
+    derived = derive_content(document.content)
+    for field, value in derived.items():
+        setattr(document, field, value)
+
+    # Значения передаются явно: в UPDATE правая часть видит старые значения колонок
+    Document.objects.filter(pk=document.pk).update(
+        search_vector=document_search_vector(Value(document.title), Value(document.plain_text)),
+        **derived
+    )
+    return True
@@ -0,0 +1,189 @@
+"""
+Сравнение двух версий содержимого документа по блокам EditorJS.
+
+Блоки сопоставляются по id (блоки без id - по совпадению данных). Для каждой
+пары версий вычисляются:
+- inserted - блок есть только в новой версии;
+- deleted - блок есть только в старой версии;
+- modified - данные блока изменились, для текста строится пословная разница;
+- moved - блок сменил место относительно остальных совпавших блоков
+  (порядок совпавших блоков сравнивается по наибольшей общей подпоследовательности).
+Неизменные блоки в результат не попадают, передается только их количество.
+
+Версии истории не меняются, поэтому результат кэшируется по паре записей.
+"""
+import difflib
+import json
+import re
+from django.conf import settings
+from django.core.cache import cache
+from .content import get_blocks, get_block_text
+
+# Время жизни сравнения версий в кэше (сек)
+HISTORY_DIFF_CACHE_TIMEOUT = getattr(settings, 'DOCUMENTS_HISTORY_DIFF_CACHE_TIMEOUT', 24 * 60 * 60)
+
+INSERTED = 'inserted'
+DELETED = 'deleted'
+MODIFIED = 'modified'
+MOVED = 'moved'
+
+# Отрезки текстовой разницы: без изменений, удалено, добавлено
+TEXT_EQUAL = '='
+TEXT_DELETE = '-'
+TEXT_INSERT = '+'
+
+# Слова, пробелы и отдельные знаки препинания
+TOKEN_RE = re.compile(r'\w+|\s+|[^\w\s]', re.UNICODE)
+
+
+def _block_key(block):
+    """
+    Ключ сопоставления блока: id из EditorJS, иначе данные блока
+    """
+    if isinstance(block, dict) and block.get('id'):
+        return ('id', str(block['id']))
+    return ('data', json.dumps(block, sort_keys=True, ensure_ascii=False))
+
+
+def _index_blocks(content):
+    """
+    {ключ: (позиция, блок)}. Повторяющиеся ключи (одинаковые блоки без id)
+    различаются порядковым номером
+    """
+    indexed = {}
+    for index, block in enumerate(get_blocks(content)):
+        key = _block_key(block)
+        occurrence = 0
+        while (key, occurrence) in indexed:
+            occurrence += 1
+        indexed[(key, occurrence)] = (index, block)
+    return indexed
+
+
+def _block_text(block):
+    return get_block_text(block) if isinstance(block, dict) else ''
+
+
+def _block_field(block, name):
+    """
+    Поле блока (id, type) или None для некорректного блока (не словаря)
+    """
+    return block.get(name) if isinstance(block, dict) else None
+
+
+def diff_text(old, new):
+    """
+    Пословная разница строк: список отрезков [операция, текст]
+    """
+    old_tokens, new_tokens = TOKEN_RE.findall(old), TOKEN_RE.findall(new)
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+
+    segments = []
+
+    def append(operation, tokens):
+        text = ''.join(tokens)
+        if not text:
+            return
+        if segments and segments[-1][0] == operation:
+            segments[-1][1] += text
+        else:
+            segments.append([operation, text])
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            append(TEXT_EQUAL, old_tokens[i1:i2])
+        else:
+            append(TEXT_DELETE, old_tokens[i1:i2])
+            append(TEXT_INSERT, new_tokens[j1:j2])
+    return segments
+
+
+def diff_versions(old, new):
+    """
+    Разница содержимого old -> new по блокам:
+    {'blocks': [изменения в порядке новой версии], 'unchanged': количество}.
+    Удаленный блок стоит после блока, который предшествовал ему в старой версии
+    """
+    old_blocks, new_blocks = _index_blocks(old), _index_blocks(new)
+    common = [key for key in new_blocks if key in old_blocks]
+
+    # Совпавшие блоки в порядке старой и новой версии; вне общей подпоследовательности - перемещены
+    old_order = sorted(common, key=lambda key: old_blocks[key][0])
+    new_order = sorted(common, key=lambda key: new_blocks[key][0])
+    matcher = difflib.SequenceMatcher(None, old_order, new_order, autojunk=False)
+    in_place = set()
+    for i, _, size in matcher.get_matching_blocks():
+        in_place.update(old_order[i:i + size])
+
+    changes = []
+    unchanged = 0
+    for key, (new_index, block) in new_blocks.items():
+        if key not in old_blocks:
+            changes.append((new_index, 0, {
+                'status': INSERTED,
+                'id': _block_field(block, 'id'),
+                'type': _block_field(block, 'type'),
+                'old_index': None,
+                'new_index': new_index,
+                'block': block,
+            }))
+            continue
+
+        old_index, old_block = old_blocks[key]
+        moved = key not in in_place
+        modified = old_block != block
+        if not moved and not modified:
+            unchanged += 1
+            continue
+
+        change = {
+            'status': MODIFIED if modified else MOVED,
+            'id': _block_field(block, 'id'),
+            'type': _block_field(block, 'type'),
+            'old_index': old_index,
+            'new_index': new_index,
+            'moved': moved,
+        }
+        if modified:
+            change['block'] = block
+            change['type_changed'] = _block_field(old_block, 'type') != _block_field(block, 'type')
+            change['text'] = diff_text(_block_text(old_block), _block_text(block))
+        changes.append((new_index, 0, change))
+
+    # Удаленный блок показывается после блока, который предшествовал ему в старой версии
+    anchor = -1
+    for key, (old_index, block) in old_blocks.items():
+        if key in new_blocks:
+            anchor = new_blocks[key][0]
+            continue
+        changes.append((anchor, 1 + old_index, {
+            'status': DELETED,
+            'id': _block_field(block, 'id'),
+            'type': _block_field(block, 'type'),
+            'old_index': old_index,
+            'new_index': None,
+            'block': block,
+        }))
+
+    changes.sort(key=lambda item: (item[0], item[1]))
+    return {
+        'blocks': [change for _, _, change in changes],
+        'unchanged': unchanged,
+    }
+
+
+def diff_cache_key(document_id, from_id, to_id):
+    return f"documents:history-diff:{document_id}:{from_id}:{to_id}"
+
+
+def get_versions_diff(document_id, from_id, to_id, load_content):
+    """
+    Сравнение версий записей истории from_id -> to_id из кэша или вычисленное
+    заново; load_content(entry_id) возвращает содержимое версии
+    """
+    key = diff_cache_key(document_id, from_id, to_id)
+    result = cache.get(key)
+    if result is None:
+        result = diff_versions(load_content(from_id), load_content(to_id))
+        cache.set(key, result, HISTORY_DIFF_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,88 @@
+"""
+Выборочные поля ответа (sparse fieldsets).
+
+GET-запросы к документам принимают параметры fields=a,b (оставить только эти поля)
+и omit=c,d (убрать поля). По тем же параметрам queryset загружает из БД только
+нужные колонки: крупные JSON/текстовые колонки (content и производные поля)
+не читаются, если их нет в ответе.
+"""
+from rest_framework.exceptions import ValidationError
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+# Крупные колонки, которые не загружаются, если не попали в ответ
+HEAVY_FIELDS = ('content', 'plain_text', 'outline', 'block_types', 'search_vector')
+
+# Колонки, нужные всегда: дерево MPTT (has_children, descendants_count, path, is_root)
+# и поля сортировки курсорной пагинации
+REQUIRED_FIELDS = ('id', 'parent', 'tree_id', 'lft', 'rght', 'level', 'title', 'created_at')
+
+
+def _parse_names(request, param):
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_requested_fields(request, available):
+    """
+    Возвращает множество полей ответа по параметрам fields/omit
+    или None, если ответ не ограничен. Неизвестные поля - ошибка 400
+    """
+    if request is None or request.method != 'GET':
+        return None
+
+    fields = _parse_names(request, FIELDS_QUERY_PARAM)
+    omit = _parse_names(request, OMIT_QUERY_PARAM)
+    if fields is None and omit is None:
+        return None
+
+    for param, names in ((FIELDS_QUERY_PARAM, fields), (OMIT_QUERY_PARAM, omit)):
+        unknown = sorted((names or set()) - set(available))
+        if unknown:
+            raise ValidationError({param: f"Неизвестные поля: {', '.join(unknown)}"})
+
+    requested = set(fields) if fields is not None else set(available)
+    return requested - (omit or set())
+
+
+class SparseFieldsetMixin:
+    """
+    Миксин сериализатора: убирает поля, не запрошенные параметрами fields/omit
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = get_requested_fields(self.context.get('request'), self.fields.keys())
+        if requested is not None:
+            for name in set(self.fields.keys()) - requested:
+                self.fields.pop(name)
+
+
+def restrict_queryset(queryset, serializer_class, request):
+    """
+    Ограничивает загружаемые колонки полями ответа: при fields= загружает только
+    колонки запрошенных полей (only), иначе откладывает крупные колонки вне ответа (defer)
+    """
+    serializer_fields = serializer_class().fields
+    requested = get_requested_fields(request, serializer_fields.keys())
+    if requested is None:
+        requested = set(serializer_fields.keys())
+
+    model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+    sources = {
+        serializer_fields[name].source.split('.')[0]
+        for name in requested
+        if serializer_fields[name].source != '*'
+    }
+    needed = sources & model_fields
+
+    if request is not None and request.method == 'GET' and _parse_names(request, FIELDS_QUERY_PARAM):
+        if 'owner' not in needed:
+            # Владелец не нужен - не присоединяем его таблицу
+            queryset = queryset.select_related(None)
+        return queryset.only(*(needed | set(REQUIRED_FIELDS)))
+
+    return queryset.defer(*(name for name in HEAVY_FIELDS if name not in needed))
@@ -0,0 +1,329 @@
+"""
+Хранение версий содержимого в истории документа дельтами.
+
+Запись истории с содержимым (создание, редактирование, изменение заголовка)
+хранит в changes одно из двух:
+- 'content' - полное содержимое (опорная версия, keyframe);
+- 'delta' и 'base' - изменения блоков относительно записи base.
+
+Дельта строится по блокам EditorJS: неизменные отрезки старого списка блоков
+ссылаются на него по индексам, в дельту попадают только новые и измененные блоки
+и изменившиеся поля верхнего уровня (time, version). Не реже чем раз в
+KEYFRAME_INTERVAL версий записывается опорная версия, поэтому восстановление
+любой версии применяет не больше KEYFRAME_INTERVAL - 1 дельт.
+
+Последняя записанная версия документа (голова) хранится в памяти процесса.
+Если головы нет (первое редактирование в процессе, перезапуск) или ее запись
+еще не подтверждена сбросом буфера, пишется опорная версия. Каждая дельта явно
+ссылается на свою базу, поэтому параллельные записи из разных процессов образуют
+ветви, но каждая версия восстанавливается верно.
+"""
+import copy
+import difflib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, BooleanField, ExpressionWrapper, JSONField
+from django.db.models.expressions import RawSQL
+from .cache import LocalLRUCache
+from .models import DocumentHistory
+from .visibility import has_access
+
+# Опорная версия записывается не реже чем раз в KEYFRAME_INTERVAL версий
+KEYFRAME_INTERVAL = getattr(settings, 'DOCUMENTS_HISTORY_KEYFRAME_INTERVAL', 20)
+
+# Головы истории в процессе: количество документов и время жизни (сек)
+HEADS_SIZE = 1000
+HEADS_TIMEOUT = 60 * 60
+
+# Записи истории, в которых хранится версия содержимого
+CONTENT_CHANGES = Q(changes__has_key='content') | Q(changes__has_key='delta')
+
+# Ключи changes с версией содержимого, которые не попадают в краткую ленту истории
+VERSION_KEYS = ['content', 'delta', 'base']
+
+# Операции дельты списка блоков: скопировать отрезок старого списка или вставить новые блоки
+COPY = '='
+INSERT = '+'
+
+_heads = LocalLRUCache(HEADS_SIZE, HEADS_TIMEOUT)
+_heads_lock = threading.Lock()
+
+
+def _block_key(block):
+    return json.dumps(block, sort_keys=True, ensure_ascii=False)
+
+
+def diff_content(old, new):
+    """
+    Дельта содержимого EditorJS old -> new или None, если содержимое не в формате
+    {blocks: [...]} и хранить его можно только целиком
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    old_blocks, new_blocks = old.get('blocks'), new.get('blocks')
+    if not isinstance(old_blocks, list) or not isinstance(new_blocks, list):
+        return None
+
+    matcher = difflib.SequenceMatcher(
+        None, [_block_key(block) for block in old_blocks], [_block_key(block) for block in new_blocks],
+        autojunk=False
+    )
+    blocks = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            blocks.append([COPY, i1, i2 - i1])
+        elif j2 > j1:
+            # replace и insert; удаленные блоки просто не копируются
+            blocks.append([INSERT, new_blocks[j1:j2]])
+
+    keys = (set(old) | set(new)) - {'blocks'}
+    return {
+        'blocks': blocks,
+        'set': {key: new[key] for key in keys if key in new and old.get(key) != new[key]},
+        'unset': sorted(key for key in keys if key not in new),
+    }
+
+
+def apply_delta(old, delta):
+    """
+    Восстанавливает содержимое по предыдущей версии и дельте
+    """
+    blocks = []
+    for operation in delta['blocks']:
+        if operation[0] == COPY:
+            start, count = operation[1], operation[2]
+            blocks.extend(copy.deepcopy(old['blocks'][start:start + count]))
+        else:
+            blocks.extend(copy.deepcopy(operation[1]))
+
+    content = {key: copy.deepcopy(value) for key, value in old.items() if key != 'blocks' and key not in delta['unset']}
+    content.update(copy.deepcopy(delta['set']))
+    content['blocks'] = blocks
+    return content
+
+
+def with_summary(queryset):
+    """
+    Добавляет к записям истории краткие изменения без версии содержимого (summary)
+    и признак has_content. Ключи отбрасываются в БД оператором jsonb -, поэтому
+    содержимое не передается в приложение и не разбирается
+    """
+    return queryset.annotate(
+        summary=RawSQL(
+            f'"{DocumentHistory._meta.db_table}"."changes" - %s::text[]',
+            (VERSION_KEYS,),
+            output_field=JSONField()
+        ),
+        has_content=ExpressionWrapper(CONTENT_CHANGES, output_field=BooleanField()),
+    )
+
+
+def summary_queryset(document):
+    """
+    Лента истории документа: пользователь и заголовок одним JOIN,
+    без колонки changes и без содержимого документа
+    """
+    return with_summary(
+        DocumentHistory.objects.filter(document_id=document.pk)
+        .select_related('user', 'document')
+        .only(
+            'id', 'document', 'user', 'action_type', 'created_at',
+            'user__username', 'user__email', 'document__title'
+        )
+    )
+
+
+def subtree_activity_queryset(document, user, action_types=None, user_ids=None):
+    """
+    Общая лента истории поддерева документа (без удаленных в корзину документов)
+    по документам, которые пользователь user может открыть. Поддерево выбирается
+    по границам MPTT в том же JOIN, которым подгружается заголовок документа,
+    поэтому лента строится одним запросом
+    """
+    queryset = DocumentHistory.objects.filter(
+        Q(document__owner_id=user.pk) | has_access(user, 'document_id'),
+        document__tree_id=document.tree_id,
+        document__lft__gte=document.lft,
+        document__rght__lte=document.rght,
+        document__is_trashed=False,
+    )
+    if action_types:
+        queryset = queryset.filter(action_type__in=action_types)
+    if user_ids:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return with_summary(
+        queryset.select_related('user', 'document').only(
+            'id', 'document', 'user', 'action_type', 'created_at',
+            'user__username', 'user__email', 'document__title'
+        )
+    )
+
+
+def reserve_history_ids(count=1):
+    """
+    Резервирует значения первичного ключа истории: запись из буфера может стать
+    базой следующей дельты раньше, чем попадет в БД
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [DocumentHistory._meta.db_table, count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def encode_version(document_id, content):
+    """
+    Готовит запись версии содержимого: резервирует ID и возвращает (id, поля changes) -
+    дельту к последней записанной версии или опорную версию. Обновляет голову документа.
+    Базой дельты становится только голова, запись которой уже подтверждена в БД
+    (confirm_version): запись из буфера может быть потеряна, и дельты, ссылающиеся
+    на нее, не восстановились бы
+    """
+    entry_id = reserve_history_ids()[0]
+    with _heads_lock:
+        head = _heads.get(document_id)
+
+        delta = None
+        if head is not None and head['persisted'] and head['depth'] + 1 < KEYFRAME_INTERVAL:
+            delta = diff_content(head['content'], content)
+
+        if delta is None:
+            fields, depth = {'content': content}, 0
+        else:
+            fields, depth = {'delta': delta, 'base': head['id']}, head['depth'] + 1
+
+        _heads.set(document_id, None, {
+            'id': entry_id, 'depth': depth, 'content': copy.deepcopy(content), 'persisted': False
+        })
+    return entry_id, fields
+
+
+def confirm_version(document_id, entry_id):
+    """
+    Отмечает, что запись версии entry_id сохранена в БД: если она все еще голова
+    документа, следующая версия может храниться дельтой к ней
+    """
+    with _heads_lock:
+        head = _heads.get(document_id)
+        if head is not None and head['id'] == entry_id:
+            _heads.set(document_id, None, {**head, 'persisted': True})
+
+
+def is_version_entry(entry):
+    """
+    True, если запись истории хранит версию содержимого
+    """
+    changes = entry.changes or {}
+    return 'content' in changes or 'delta' in changes
+
+
+def get_version_content(entry):
+    """
+    Содержимое документа в версии записи истории entry
+    или None, если запись не хранит содержимое
+    """
+    changes = entry.changes or {}
+    if 'content' in changes:
+        return changes['content']
+    if 'delta' not in changes:
+        return None
+
+    # Цепочка до опорной версии обычно лежит среди ближайших предыдущих записей
+    rows = {
+        row['id']: row['changes']
+        for row in DocumentHistory.objects.filter(
+            CONTENT_CHANGES, document_id=entry.document_id, id__lt=entry.id
+        ).order_by('-id').values('id', 'changes')[:KEYFRAME_INTERVAL * 2]
+    }
+
+    deltas = [changes['delta']]
+    base_id = changes['base']
+    while True:
+        base = rows.get(base_id)
+        if base is None:
+            # Ветвь от параллельной записи могла начаться раньше окна
+            base = DocumentHistory.objects.filter(pk=base_id).values_list('changes', flat=True).first()
+            if base is None:
+                raise DocumentHistory.DoesNotExist(f"Базовая версия истории {base_id} не найдена")
+        if 'content' in base:
+            content = base['content']
+            break
+        deltas.append(base['delta'])
+        base_id = base['base']
+
+    for delta in reversed(deltas):
+        content = apply_delta(content, delta)
+    return content
+
+
+def make_keyframe(entry, content):
+    """
+    Переводит запись-дельту в опорную версию с содержимым content
+    """
+    changes = {key: value for key, value in entry.changes.items() if key not in ('delta', 'base')}
+    changes['content'] = content
+    entry.changes = changes
+    return entry
+
+
+def compress_document_history(document_id, batch_size=500):
+    """
+    Переводит полные версии истории документа в дельты, оставляя опорную версию
+    раз в KEYFRAME_INTERVAL записей. Уже сжатые записи не меняются.
+    Возвращает (количество сжатых записей, байт до, байт после)
+    """
+    rows = DocumentHistory.objects.filter(
+        CONTENT_CHANGES, document_id=document_id
+    ).order_by('id').only('id', 'changes').iterator(chunk_size=batch_size)
+
+    # Содержимое и глубина недавних версий: база дельты почти всегда среди них
+    recent = OrderedDict()
+    previous_id = None
+    compressed, size_before, size_after = 0, 0, 0
+    pending = []
+
+    for entry in rows:
+        changes = entry.changes
+        if 'delta' in changes:
+            base = recent.get(changes['base'])
+            if base is None:
+                content = get_version_content(entry)
+                depth = KEYFRAME_INTERVAL
+            else:
+                content = apply_delta(base[0], changes['delta'])
+                depth = base[1] + 1
+        else:
+            content = changes['content']
+            previous = recent.get(previous_id)
+            delta = None
+            if previous is not None and previous[1] + 1 < KEYFRAME_INTERVAL:
+                delta = diff_content(previous[0], content)
+
+            if delta is None:
+                depth = 0
+            else:
+                depth = previous[1] + 1
+                before = len(json.dumps(changes, ensure_ascii=False))
+                rest = {key: value for key, value in changes.items() if key != 'content'}
+                entry.changes = {**rest, 'delta': delta, 'base': previous_id}
+                size_before += before
+                size_after += len(json.dumps(entry.changes, ensure_ascii=False))
+                compressed += 1
+                pending.append(entry)
+
+        recent[entry.id] = (content, depth)
+        while len(recent) > KEYFRAME_INTERVAL * 2:
+            recent.popitem(last=False)
+        previous_id = entry.id
+
+        if len(pending) >= batch_size:
+            DocumentHistory.objects.bulk_update(pending, ['changes'])
+            pending = []
+
+    if pending:
+        DocumentHistory.objects.bulk_update(pending, ['changes'])
+    return compressed, size_before, size_after
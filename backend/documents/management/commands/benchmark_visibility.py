@@ -0,0 +1,81 @@
+import json
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.core.management.base import BaseCommand, CommandError
+from documents.search import SEARCH_CONFIG
+from documents.visibility import visible_documents, shared_documents, visible_tasks
+from tasks.models import Task
+
+User = get_user_model()
+
+# Узлы плана, появление которых означает устранение дублей (регресс к JOIN + DISTINCT)
+DEDUPLICATION_NODES = ('Unique', 'HashAggregate')
+
+
+class Command(BaseCommand):
+    """
+    Замер запросов видимости (EXPLAIN ANALYZE) для пользователя.
+    Завершается с ошибкой, если в плане снова появилось устранение дублей
+    или запрос медленнее порога --max-ms
+    """
+    help = 'Проверяет планы и время запросов видимости документов и задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='ID или имя пользователя')
+        parser.add_argument('--q', default='', help='Поисковый запрос для проверки поиска')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Количество повторов каждого запроса (берется лучшее время)')
+        parser.add_argument('--max-ms', type=float, default=None,
+                            help='Допустимое время выполнения запроса (мс)')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+
+        queries = {
+            'documents': visible_documents(user).filter(is_trashed=False).order_by('-created_at', '-id')[:50],
+            'shared_with_me': shared_documents(user).filter(is_trashed=False).order_by('title', 'id')[:50],
+            'tasks': visible_tasks(user, Task.objects.filter(document__is_trashed=False))[:50],
+        }
+        if options['q']:
+            search_query = SearchQuery(options['q'], config=SEARCH_CONFIG, search_type='websearch')
+            queries['search'] = visible_documents(user).filter(
+                search_vector=search_query, is_trashed=False
+            ).order_by('-id')[:20]
+
+        failures = []
+        for name, queryset in queries.items():
+            best, plan = None, None
+            for _ in range(max(1, options['repeat'])):
+                result = json.loads(queryset.explain(analyze=True, format='json'))[0]
+                if best is None or result['Execution Time'] < best:
+                    best, plan = result['Execution Time'], result['Plan']
+
+            nodes = list(self.iter_nodes(plan))
+            node_types = sorted({node['Node Type'] for node in nodes})
+            seq_scans = sorted({node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan'})
+
+            self.stdout.write(f"{name}: {best:.2f} мс, узлы: {', '.join(node_types)}")
+            if seq_scans:
+                self.stdout.write(f"  последовательное чтение: {', '.join(seq_scans)}")
+
+            dedup = [node_type for node_type in node_types if node_type in DEDUPLICATION_NODES]
+            if dedup:
+                failures.append(f"{name}: устранение дублей в плане ({', '.join(dedup)})")
+            if options['max_ms'] is not None and best > options['max_ms']:
+                failures.append(f"{name}: {best:.2f} мс больше порога {options['max_ms']} мс")
+
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS("Планы запросов видимости в порядке"))
+
+    def get_user(self, value):
+        lookup = {'pk': int(value)} if value.isdigit() else {'username': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {value} не найден")
+
+    def iter_nodes(self, node):
+        yield node
+        for child in node.get('Plans', []):
+            yield from self.iter_nodes(child)
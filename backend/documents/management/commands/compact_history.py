@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from documents.retention import HISTORY_RETENTION_DAYS, HISTORY_HOURLY_DAYS, iter_compaction
+
+
+class Command(BaseCommand):
+    """
+    Фоновое уплотнение истории документов: прореживание старых версий и свертка
+    просмотров в счетчики. Работает пачками документов и продолжает с позиции,
+    на которой остановился предыдущий запуск
+    """
+    help = 'Уплотняет историю документов старше срока хранения'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Количество документов, обрабатываемых в одной транзакции')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Максимальное количество документов за один запуск')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза в секундах между пачками')
+    
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Вся история хранится {HISTORY_RETENTION_DAYS} дн., "
+            f"версии по часам - до {HISTORY_HOURLY_DAYS} дн., далее по дням"
+        )
+        
+        progress = None
+        for progress in iter_compaction(batch_size=max(1, options['batch_size']), max_documents=options['limit']):
+            self.stdout.write(
+                f"[document<={progress['position']}] документов: {progress['documents']}, "
+                f"удалено версий: {progress['versions_deleted']}, опорных версий: {progress['keyframes']}, "
+                f"свернуто просмотров: {progress['views_aggregated']}, пропущено: {progress['skipped']}"
+            )
+            if options['pause']:
+                time.sleep(options['pause'])
+        
+        if progress is None:
+            self.stdout.write(self.style.SUCCESS("Уплотнять нечего"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Обработано документов: {progress['documents']}"))
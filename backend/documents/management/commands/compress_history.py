@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from documents.history import CONTENT_CHANGES, KEYFRAME_INTERVAL, compress_document_history
+from documents.models import DocumentHistory
+
+
+class Command(BaseCommand):
+    """
+    Сжатие существующей истории документов: полные версии содержимого заменяются
+    дельтами к предыдущей версии, опорная версия остается раз в KEYFRAME_INTERVAL записей.
+    Повторный запуск не меняет уже сжатые записи
+    """
+    help = 'Переводит полные версии содержимого в истории документов в дельты'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', dest='document_ids',
+                            help='Сжать историю только указанного документа (можно указать несколько раз)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество записей, обновляемых одним запросом')
+    
+    def handle(self, *args, **options):
+        document_ids = options['document_ids'] or list(
+            DocumentHistory.objects.filter(CONTENT_CHANGES)
+            .order_by('document_id').values_list('document_id', flat=True).distinct()
+        )
+        batch_size = max(1, options['batch_size'])
+        
+        self.stdout.write(f"Документов для обработки: {len(document_ids)}, опорная версия раз в {KEYFRAME_INTERVAL} записей")
+        
+        total, before, after = 0, 0, 0
+        for document_id in document_ids:
+            compressed, size_before, size_after = compress_document_history(document_id, batch_size=batch_size)
+            total += compressed
+            before += size_before
+            after += size_after
+            if compressed:
+                self.stdout.write(f"[document={document_id}] сжато записей: {compressed}")
+        
+        ratio = f", в {before / after:.1f} раз меньше" if after else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Сжато записей: {total}, объем {before} -> {after} байт{ratio}"
+        ))
@@ -0,0 +1,37 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.db import connection
+from documents.partitions import (
+    PARTITIONS_AHEAD, add_months, month_start, ensure_partitions, detach_partitions, list_partitions
+)
+
+
+class Command(BaseCommand):
+    """
+    Обслуживание секций истории документов: создание месяцев вперед
+    и отсоединение (удаление) старых месяцев
+    """
+    help = 'Создает будущие и отсоединяет старые помесячные секции истории документов'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=PARTITIONS_AHEAD,
+                            help='На сколько месяцев вперед создать секции')
+        parser.add_argument('--detach-older-than', type=int, default=None, dest='detach_months',
+                            help='Отсоединить секции месяцев, закончившихся раньше указанного числа месяцев назад')
+        parser.add_argument('--drop', action='store_true',
+                            help='Удалить отсоединенные секции вместе с данными')
+    
+    def handle(self, *args, **options):
+        created = ensure_partitions(ahead=max(0, options['ahead']))
+        for name in created:
+            self.stdout.write(f"Создана секция {name}")
+        
+        if options['detach_months'] is not None:
+            before = add_months(month_start(datetime.datetime.now(datetime.timezone.utc)), -options['detach_months'])
+            for name in detach_partitions(before, drop=options['drop']):
+                action = "Удалена" if options['drop'] else "Отсоединена"
+                self.stdout.write(f"{action} секция {name}")
+        
+        with connection.cursor() as cursor:
+            partitions = list_partitions(cursor) if connection.vendor == 'postgresql' else {}
+        self.stdout.write(self.style.SUCCESS(f"Месячных секций: {len(partitions)}"))
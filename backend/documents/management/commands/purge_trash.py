@@ -0,0 +1,47 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from documents.models import Document
+from documents.tree import trash_roots, purge_subtree
+
+
+class Command(BaseCommand):
+    """
+    Фоновая очистка корзины: физически удаляет документы, пролежавшие в корзине дольше срока хранения.
+    Удаление идет ограниченными пачками, чтобы не держать блокировки долго
+    """
+    help = 'Окончательно удаляет документы из корзины пачками'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Удалять документы, находящиеся в корзине дольше указанного числа дней')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество документов, удаляемых в одной транзакции')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Максимальное количество поддеревьев за один запуск')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза в секундах между поддеревьями')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        roots = trash_roots().filter(trashed_at__lt=cutoff).order_by('trashed_at')
+        if options['limit']:
+            roots = roots[:options['limit']]
+        
+        purged_roots = 0
+        purged_documents = 0
+        for root in roots:
+            try:
+                purged_documents += purge_subtree(root, batch_size=max(1, options['batch_size']))
+                purged_roots += 1
+            except Document.DoesNotExist:
+                # Документ уже удален другим процессом
+                continue
+            
+            if options['pause']:
+                time.sleep(options['pause'])
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Очищено поддеревьев: {purged_roots}, удалено документов: {purged_documents}"
+        ))
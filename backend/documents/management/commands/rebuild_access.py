@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from documents.access import rebuild_effective_access
+from documents.models import EffectiveAccess
+
+
+class Command(BaseCommand):
+    """
+    Пересборка таблицы эффективных прав доступа из AccessRight и структуры деревьев.
+    Нужна после ручных изменений прав или перестройки деревьев (rebuild_tree)
+    """
+    help = 'Пересобирает таблицу эффективных прав доступа к документам'
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_effective_access()
+        
+        self.stdout.write(self.style.SUCCESS(f"Строк эффективных прав: {EffectiveAccess.objects.count()}"))
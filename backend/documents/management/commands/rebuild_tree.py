@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from documents.models import Document
+from documents.tree import verify_tree, rebuild_tree
+
+
+class Command(BaseCommand):
+    """
+    Проверка и восстановление деревьев документов (MPTT).
+    Каждое дерево обрабатывается под своей блокировкой, разные деревья - параллельно
+    """
+    help = 'Проверяет и перестраивает деревья документов по tree_id'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--tree-id', type=int, action='append', dest='tree_ids',
+                            help='Обработать только указанное дерево (можно указать несколько раз)')
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить деревья, ничего не исправляя')
+        parser.add_argument('--all', action='store_true', dest='rebuild_all',
+                            help='Перестроить деревья, даже если проверка не нашла ошибок')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Количество деревьев, обрабатываемых параллельно')
+    
+    def handle(self, *args, **options):
+        tree_ids = options['tree_ids'] or list(
+            Document.objects.order_by('tree_id').values_list('tree_id', flat=True).distinct()
+        )
+        self.check_only = options['check']
+        self.rebuild_all = options['rebuild_all']
+        
+        self.stdout.write(f"Деревьев для обработки: {len(tree_ids)}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            results = list(executor.map(self.process_tree, tree_ids))
+        
+        broken = [tree_id for tree_id, errors in results if errors]
+        if broken:
+            self.stdout.write(self.style.ERROR(f"Деревья с ошибками: {', '.join(map(str, broken))}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Все деревья корректны"))
+    
+    def process_tree(self, tree_id):
+        """
+        Проверяет одно дерево и при необходимости перестраивает его.
+        Возвращает (tree_id, ошибки, оставшиеся после обработки)
+        """
+        try:
+            errors = verify_tree(tree_id)
+            for error in errors:
+                self.stdout.write(f"[tree_id={tree_id}] {error}")
+            
+            if self.check_only or not (errors or self.rebuild_all):
+                return tree_id, errors
+            
+            try:
+                rebuild_tree(tree_id)
+            except RuntimeError as e:
+                # partial_rebuild не справляется с несколькими корнями в одном дереве
+                self.stdout.write(self.style.ERROR(f"[tree_id={tree_id}] {e}"))
+                return tree_id, errors
+            
+            errors = verify_tree(tree_id)
+            if errors:
+                self.stdout.write(self.style.ERROR(f"[tree_id={tree_id}] После перестройки остались ошибки"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"[tree_id={tree_id}] Дерево перестроено"))
+            return tree_id, errors
+        finally:
+            # У каждого потока свое соединение с БД
+            connection.close()
@@ -0,0 +1,21 @@
+"""
+ASGI-обертка, запускающая в процессе слушателя сбросов кэша документов.
+"""
+import asyncio
+from .cache import listen_for_invalidations
+
+
+class CacheInvalidationListenerMiddleware:
+    """
+    При первом запросе запускает в цикле событий процесса фоновую задачу,
+    которая очищает L1-кэш документов по сообщениям других процессов
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.listener = None
+
+    async def __call__(self, scope, receive, send):
+        if self.listener is None:
+            self.listener = asyncio.ensure_future(listen_for_invalidations())
+        return await self.app(scope, receive, send)
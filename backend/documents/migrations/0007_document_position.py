@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+from documents.ordering import key_after
+
+
+def fill_positions(apps, schema_editor):
+    """
+    Проставляет ключи порядка существующим документам, сохраняя текущий
+    порядок соседей в дереве (по lft)
+    """
+    Document = apps.get_model("documents", "Document")
+
+    batch = []
+    current_parent = None
+    key = None
+    for document in (
+        Document.objects.filter(parent__isnull=False)
+        .order_by("parent_id", "lft")
+        .only("id", "parent_id")
+        .iterator(chunk_size=2000)
+    ):
+        if document.parent_id != current_parent:
+            current_parent = document.parent_id
+            key = None
+        key = key_after(key)
+        document.position = key
+        batch.append(document)
+
+        if len(batch) >= 2000:
+            Document.objects.bulk_update(batch, ["position"])
+            batch = []
+
+    if batch:
+        Document.objects.bulk_update(batch, ["position"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0006_alter_documenthistory_action_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="position",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                fields=["parent", "position"], name="document_sibling_position_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0007_document_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="is_trashed",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="trashed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(fields=["tree_id", "lft"], name="document_tree_lft_idx"),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+from documents.content import extract_plain_text
+
+
+def fill_search_index(apps, schema_editor):
+    """
+    Извлекает простой текст из содержимого существующих документов
+    и строит поисковые векторы одним UPDATE
+    """
+    Document = apps.get_model("documents", "Document")
+    config = getattr(settings, "DOCUMENTS_SEARCH_CONFIG", "russian")
+
+    batch = []
+    for document in Document.objects.only("id", "content").iterator(chunk_size=2000):
+        document.plain_text = extract_plain_text(document.content)
+        batch.append(document)
+
+        if len(batch) >= 2000:
+            Document.objects.bulk_update(batch, ["plain_text"])
+            batch = []
+
+    if batch:
+        Document.objects.bulk_update(batch, ["plain_text"])
+
+    Document.objects.update(
+        search_vector=SearchVector("title", weight="A", config=config)
+        + SearchVector("plain_text", weight="B", config=config)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0008_document_trash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="plain_text",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="document",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="document_search_vector_idx"
+            ),
+        ),
+    ]
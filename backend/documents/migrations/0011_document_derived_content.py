@@ -0,0 +1,76 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+from documents.content import derive_content
+
+DERIVED_FIELDS = [
+    "plain_text",
+    "word_count",
+    "outline",
+    "block_types",
+    "tasks_count",
+    "completed_tasks_count",
+    "content_hash",
+]
+
+
+def fill_derived_content(apps, schema_editor):
+    """
+    Вычисляет производные поля содержимого для существующих документов.
+    Поисковый вектор зависит только от заголовка и plain_text и уже построен
+    """
+    Document = apps.get_model("documents", "Document")
+
+    batch = []
+    for document in Document.objects.only("id", "content").iterator(chunk_size=2000):
+        for field, value in derive_content(document.content).items():
+            setattr(document, field, value)
+        batch.append(document)
+
+        if len(batch) >= 2000:
+            Document.objects.bulk_update(batch, DERIVED_FIELDS)
+            batch = []
+
+    if batch:
+        Document.objects.bulk_update(batch, DERIVED_FIELDS)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0010_document_title_trgm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="word_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="outline",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="block_types",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="tasks_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="completed_tasks_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_derived_content, migrations.RunPython.noop),
+    ]
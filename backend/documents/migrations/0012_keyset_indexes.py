@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0011_document_derived_content"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documenthistory",
+            index=models.Index(
+                fields=["document", "-created_at", "-id"],
+                name="history_document_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                fields=["owner", "-created_at", "-id"],
+                name="document_owner_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Права документа и, при include_children, его поддерева (см. documents.access)
+FILL_EFFECTIVE_ACCESS = """
+    INSERT INTO documents_effectiveaccess (access_right_id, user_id, document_id, role)
+    SELECT ar.id, ar.user_id, d.id, ar.role
+    FROM documents_accessright ar
+    JOIN documents_document src ON src.id = ar.document_id
+    JOIN documents_document d ON d.tree_id = src.tree_id
+        AND d.lft BETWEEN src.lft AND (CASE WHEN ar.include_children THEN src.rght ELSE src.lft END)
+    ON CONFLICT (access_right_id, document_id) DO NOTHING
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0012_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EffectiveAccess",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("editor", "Редактор"), ("viewer", "Наблюдатель")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "access_right",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="effective_accesses",
+                        to="documents.accessright",
+                    ),
+                ),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="effective_accesses",
+                        to="documents.document",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="effective_document_accesses",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "document", "role"],
+                        name="effective_access_user_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("access_right", "document"),
+                        name="effective_access_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(FILL_EFFECTIVE_ACCESS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0013_effectiveaccess"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="accessright",
+            index=models.Index(
+                fields=["user", "document"],
+                name="access_right_user_document_idx",
+            ),
+        ),
+    ]
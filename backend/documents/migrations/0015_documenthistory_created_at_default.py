@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0014_access_right_user_document_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="documenthistory",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
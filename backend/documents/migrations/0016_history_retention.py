@@ -0,0 +1,78 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0015_documenthistory_created_at_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentActivityCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "action_type",
+                    models.CharField(
+                        choices=[
+                            ("edit", "Редактирование"),
+                            ("create", "Создание"),
+                            ("view", "Просмотр"),
+                            ("share", "Предоставление доступа"),
+                            ("revoke", "Отзыв доступа"),
+                            ("title_change", "Изменение заголовка"),
+                            ("nested_create", "Создание вложенного документа"),
+                            ("task_complete", "Завершение задачи"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity_counters",
+                        to="documents.document",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("document", "date", "action_type"),
+                        name="activity_counter_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="MaintenanceCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("position", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
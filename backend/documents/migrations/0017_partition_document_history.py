@@ -0,0 +1,112 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:30
+
+import datetime
+
+from django.db import migrations
+
+TABLE = "documents_documenthistory"
+NEW_TABLE = "documents_documenthistory_new"
+SEQUENCE = "documents_documenthistory_id_seq"
+COLUMNS = "id, changes, action_type, created_at, document_id, user_id"
+
+# Сколько месяцев вперед создаются секции (как documents.partitions.PARTITIONS_AHEAD)
+PARTITIONS_AHEAD = 3
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_history(apps, schema_editor):
+    """
+    Переводит историю в секционированную по месяцам таблицу: создает новую таблицу
+    с секциями на весь период существующих данных, копирует строки и заменяет старую.
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому он становится (id, created_at); id по-прежнему выдается последовательностью
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(created_at) FROM {TABLE}")
+        oldest = cursor.fetchone()[0]
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        cursor.execute(f"CREATE SEQUENCE {SEQUENCE}_new")
+        cursor.execute(f"""
+            CREATE TABLE {NEW_TABLE} (
+                id bigint NOT NULL DEFAULT nextval('{SEQUENCE}_new'),
+                changes jsonb NOT NULL,
+                action_type varchar(20) NOT NULL,
+                created_at timestamp with time zone NOT NULL,
+                document_id bigint NOT NULL,
+                user_id bigint NULL,
+                CONSTRAINT {NEW_TABLE}_pkey PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute(f"CREATE TABLE {NEW_TABLE}_default PARTITION OF {NEW_TABLE} DEFAULT")
+
+        month = month_start(oldest or now)
+        last = add_months(month_start(now), PARTITIONS_AHEAD)
+        months = []
+        while month <= last:
+            months.append(month)
+            month = add_months(month, 1)
+
+        for month in months:
+            cursor.execute(
+                f"CREATE TABLE {NEW_TABLE}_p{month:%Y%m} PARTITION OF {NEW_TABLE} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)]
+            )
+
+        # Новые записи истории ждут замены таблицы, иначе строки, вставленные
+        # после копирования, пропали бы вместе со старой таблицей
+        cursor.execute(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE")
+        cursor.execute(f"INSERT INTO {NEW_TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE}")
+        cursor.execute(
+            f"SELECT setval('{SEQUENCE}_new', COALESCE((SELECT MAX(id) FROM {NEW_TABLE}), 0) + 1, false)"
+        )
+
+        # Замена старой таблицы; вместе с ней удаляется ее последовательность
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {NEW_TABLE}_pkey TO {TABLE}_pkey")
+        cursor.execute(f"ALTER SEQUENCE {SEQUENCE}_new RENAME TO {SEQUENCE}")
+        cursor.execute(f"ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id")
+        cursor.execute(f"ALTER TABLE {NEW_TABLE}_default RENAME TO {TABLE}_default")
+        for month in months:
+            cursor.execute(
+                f"ALTER TABLE {NEW_TABLE}_p{month:%Y%m} RENAME TO {TABLE}_p{month:%Y%m}"
+            )
+
+        # Индексы и внешние ключи создаются на родительской таблице и наследуются секциями
+        cursor.execute(
+            f"CREATE INDEX history_document_created_idx ON {TABLE} (document_id, created_at DESC, id DESC)"
+        )
+        cursor.execute(f"CREATE INDEX {TABLE}_user_id_idx ON {TABLE} (user_id)")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_document_id_fk FOREIGN KEY (document_id) "
+            f"REFERENCES documents_document (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk FOREIGN KEY (user_id) "
+            f"REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0016_history_retention"),
+        ("users", "0005_notification_recipient_idx"),
+    ]
+
+    operations = [
+        # Необратима: первичный ключ, внешние ключи и индексы пересозданы заново
+        migrations.RunPython(partition_history),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0017_partition_document_history"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documenthistory",
+            index=models.Index(
+                fields=["-created_at", "-id"],
+                name="history_created_idx",
+            ),
+        ),
+    ]
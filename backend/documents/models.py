@@ -1,12 +1,17 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from mptt.models import MPTTModel, TreeForeignKey
 
 User = settings.AUTH_USER_MODEL
 
 class DocumentHistory(models.Model):
     """
-    Модель для хранения истории изменений документа
+    Модель для хранения истории изменений документа.
+    Таблица секционирована по месяцам created_at (см. documents.partitions),
+    первичный ключ в БД - (id, created_at)
     """
     ACTION_EDIT = 'edit'
     ACTION_CREATE = 'create'
@@ -32,7 +37,16 @@ class DocumentHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='document_edits')
     changes = models.JSONField()  # Хранит данные о изменениях
     action_type = models.CharField(max_length=20, choices=ACTION_CHOICES, default=ACTION_EDIT)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Время события, а не вставки: записи пишутся из буфера пачками (см. documents.activity)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            # Лента истории документа, новые первыми (курсорная пагинация)
+            models.Index(fields=['document', '-created_at', '-id'], name='history_document_created_idx'),
+            # Лента активности поддерева: страницы большого поддерева читаются по времени
+            models.Index(fields=['-created_at', '-id'], name='history_created_idx'),
+        ]
     
     def __str__(self):
         return f"Изменение {self.document.title} пользователем {self.user.email} в {self.created_at}"
@@ -56,6 +70,10 @@ class AccessRight(models.Model):
     
     class Meta:
         unique_together = ('document', 'user')
+        indexes = [
+            # Документы, которыми поделились с пользователем (EXISTS по user, document)
+            models.Index(fields=['user', 'document'], name='access_right_user_document_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.get_role_display()} для {self.document.title}"
@@ -76,11 +94,99 @@ class Document(MPTTModel):
     # MPTT поля для древовидной структуры
     parent = TreeForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     
+    # Дробный ключ порядка среди соседей (см. documents.ordering).
+    # У документов верхнего уровня ключ пустой, чтобы новые деревья не сдвигали tree_id соседних
+    position = models.CharField(max_length=255, default='', blank=True)
+    
+    # Корзина: поддерево помечается целиком одним UPDATE по границам MPTT.
+    # trashed_at у всех документов одного удаления совпадает, по нему выполняется восстановление
+    is_trashed = models.BooleanField(default=False)
+    trashed_at = models.DateTimeField(null=True, blank=True)
+    
+    # Производные поля содержимого, пересчитываются при каждой записи content
+    # (см. documents.derived), чтобы чтение не разбирало JSON блоков
+    plain_text = models.TextField(default='', blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    outline = models.JSONField(default=list, blank=True, editable=False)  # Заголовки [{id, level, text}]
+    block_types = models.JSONField(default=dict, blank=True, editable=False)  # {тип блока: количество}
+    tasks_count = models.PositiveIntegerField(default=0, editable=False)
+    completed_tasks_count = models.PositiveIntegerField(default=0, editable=False)
+    content_hash = models.CharField(max_length=64, default='', blank=True, editable=False)
+    
+    # Поисковый вектор (заголовок + текст), см. documents.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class MPTTMeta:
-        order_insertion_by = ['title']
+        # Упорядочиваем по ключу, а не по заголовку: переименование не перестраивает дерево
+        order_insertion_by = ['position']
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent', 'position'], name='document_sibling_position_idx'),
+            models.Index(fields=['tree_id', 'lft'], name='document_tree_lft_idx'),
+            models.Index(fields=['owner', '-created_at', '-id'], name='document_owner_created_idx'),
+            GinIndex(fields=['search_vector'], name='document_search_vector_idx'),
+            # Триграммный индекс для автодополнения (ILIKE и word_similarity)
+            GinIndex(fields=['title'], name='document_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+    
+    def has_children(self):
+        """
+        Проверяет наличие дочерних документов по границам MPTT, без запроса к БД
+        """
+        return not self.is_leaf_node()
     
     def __str__(self):
         return self.title
-        
 
+class EffectiveAccess(models.Model):
+    """
+    Материализованные права доступа: строка на каждый документ, на который действует
+    право AccessRight (сам документ и, при include_children, его потомки).
+    Поддерживается модулем documents.access
+    """
+    access_right = models.ForeignKey(AccessRight, on_delete=models.CASCADE, related_name='effective_accesses')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='effective_document_accesses', db_index=False)
+    document = models.ForeignKey('Document', on_delete=models.CASCADE, related_name='effective_accesses')
+    role = models.CharField(max_length=10, choices=AccessRight.ROLE_CHOICES)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['access_right', 'document'], name='effective_access_unique'),
+        ]
+        indexes = [
+            # Проверка доступа пользователя к документу и списки доступных документов
+            models.Index(fields=['user', 'document', 'role'], name='effective_access_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.role} для {self.document_id}"
+
+class DocumentActivityCounter(models.Model):
+    """
+    Агрегированные счетчики событий истории по дням (например, просмотров),
+    в которые сворачиваются старые записи DocumentHistory (см. documents.retention)
+    """
+    document = models.ForeignKey('Document', on_delete=models.CASCADE, related_name='activity_counters')
+    date = models.DateField()
+    action_type = models.CharField(max_length=20, choices=DocumentHistory.ACTION_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'date', 'action_type'], name='activity_counter_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.document_id} {self.date} {self.action_type}: {self.count}"
 
+class MaintenanceCheckpoint(models.Model):
+    """
+    Позиция фоновой задачи обслуживания, чтобы следующий запуск продолжил с нее
+    """
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.position}"
@@ -0,0 +1,69 @@
+"""
+Дробные (лексикографические) ключи для упорядочивания документов-соседей.
+
+Ключ - строка из символов DIGITS, сравниваемая как обычная строка. Между любыми
+двумя ключами всегда можно вставить третий, поэтому при перестановке или
+добавлении документа меняется только ключ самого документа, а соседние
+записи не переписываются.
+"""
+
+# Алфавит ключей в порядке возрастания (совпадает с порядком сравнения строк)
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+# Ключ для первого документа в пустом списке соседей
+INITIAL_KEY = DIGITS[len(DIGITS) // 2]
+
+
+def _midpoint(a, b):
+    """
+    Возвращает строку строго между a и b.
+    a может быть пустой строкой (начало), b - None (конец).
+    Ключи не должны оканчиваться нулевым символом.
+    """
+    if b is not None:
+        # Общий префикс копируем как есть
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else DIGITS[0]) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b) // 2]
+
+    # Соседние символы: уходим на следующий разряд
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def key_after(key):
+    """
+    Возвращает короткий ключ, больший key (для добавления в конец списка)
+    """
+    if not key:
+        return INITIAL_KEY
+
+    # Отбрасываем старшие символы алфавита и увеличиваем последний оставшийся
+    stripped = key.rstrip(DIGITS[-1])
+    if stripped:
+        return stripped[:-1] + DIGITS[DIGITS.index(stripped[-1]) + 1]
+    return key + DIGITS[1]
+
+
+def key_between(before, after):
+    """
+    Возвращает ключ между before и after.
+    None вместо before означает начало списка, вместо after - конец списка
+    """
+    if after is not None and not after:
+        raise ValueError("Перед пустым ключом нельзя вставить другой ключ")
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"Ключ {before!r} должен быть меньше {after!r}")
+
+    if after is None:
+        return key_after(before)
+    return _midpoint(before or '', after)
@@ -0,0 +1,158 @@
+"""
+Курсорная (keyset) пагинация.
+
+Позиция страницы кодируется значениями полей сортировки последней записи,
+следующая страница выбирается условием "строго после этих значений" по индексу,
+без OFFSET. Поэтому стоимость запроса не растет с номером страницы, а записи,
+добавленные во время листания, не сдвигают страницы.
+"""
+import base64
+import datetime
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по упорядоченному набору полей, последнее поле должно быть уникальным (id).
+    Значения полей сортировки не должны быть NULL
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+
+    # Допустимые варианты сортировки {значение параметра: поля}, выбираются параметром ordering
+    ordering_options = {}
+    ordering_query_param = 'ordering'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+
+    def get_ordering(self, request):
+        """
+        Сортировка из параметра запроса (если он задан среди ordering_options)
+        """
+        value = request.query_params.get(self.ordering_query_param)
+        if value is None or not self.ordering_options:
+            return self.ordering
+        if value not in self.ordering_options:
+            raise ValidationError({
+                self.ordering_query_param: f"Допустимые значения: {', '.join(self.ordering_options)}"
+            })
+        return tuple(self.ordering_options[value])
+
+    def get_page_size(self, request):
+        """
+        Размер страницы из параметра запроса, ограниченный max_page_size
+        """
+        value = request.query_params.get(self.page_size_query_param)
+        if not value:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Размер страницы должен быть целым числом"})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: "Размер страницы должен быть положительным"})
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, values):
+        data = json.dumps([
+            value.isoformat() if isinstance(value, (datetime.datetime, datetime.date)) else value
+            for value in values
+        ])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, token):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({self.cursor_query_param: "Некорректный курсор"})
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValidationError({self.cursor_query_param: "Некорректный курсор"})
+        return values
+
+    def get_position_filter(self, values):
+        """
+        Условие "строго после позиции" для сортировки ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request)
+        page_size = self.get_page_size(request)
+
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            values = self.decode_cursor(token)
+            try:
+                # Значения курсора приводятся к типам полей при построении условия
+                queryset = queryset.filter(self.get_position_filter(values))
+            except (DjangoValidationError, ValueError, TypeError):
+                raise ValidationError({self.cursor_query_param: "Некорректный курсор"})
+
+        # Одна лишняя запись показывает, есть ли следующая страница
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        page = rows[:page_size]
+
+        self.next_cursor = None
+        if len(rows) > page_size:
+            last = page[-1]
+            self.next_cursor = self.encode_cursor([
+                getattr(last, field.lstrip('-')) for field in self.ordering
+            ])
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class DocumentPagination(KeysetPagination):
+    """
+    Пагинация списка документов: новые первыми или по заголовку
+    """
+    ordering_options = {
+        '-created_at': ('-created_at', '-id'),
+        'created_at': ('created_at', 'id'),
+        'title': ('title', 'id'),
+    }
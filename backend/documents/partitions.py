@@ -0,0 +1,176 @@
+"""
+Помесячное секционирование истории документов (PostgreSQL).
+
+Таблица DocumentHistory секционирована по диапазонам created_at: одна секция
+на календарный месяц (UTC) и секция по умолчанию для строк вне созданных
+месяцев. Запросы с условием на created_at читают только нужные секции,
+а старые месяцы отсоединяются или удаляются без DELETE по всей таблице.
+Дельты следующих месяцев, ссылающиеся на отсоединяемый месяц, перед этим
+становятся опорными версиями.
+
+Секции создаются заранее на несколько месяцев вперед: при сбросе буфера
+истории (documents.activity, раз в месяц на процесс) и командой
+history_partitions. Если строки успели попасть в секцию по умолчанию,
+при создании месяца они переносятся в новую секцию.
+"""
+import datetime
+import logging
+import re
+from django.db import connection, transaction
+from .models import DocumentHistory
+from .history import get_version_content, make_keyframe
+
+logger = logging.getLogger(__name__)
+
+# Сколько месяцев вперед создаются секции
+PARTITIONS_AHEAD = 3
+
+DEFAULT_PARTITION_SUFFIX = 'default'
+
+_PARTITION_RE = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    """
+    Начало месяца (UTC) для даты или момента времени
+    """
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month, table=None):
+    return f"{table or DocumentHistory._meta.db_table}_p{month:%Y%m}"
+
+
+def default_partition_name(table=None):
+    return f"{table or DocumentHistory._meta.db_table}_{DEFAULT_PARTITION_SUFFIX}"
+
+
+def is_partitioned(cursor, table=None):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace)",
+        [table or DocumentHistory._meta.db_table]
+    )
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor, table=None):
+    """
+    Месячные секции таблицы: {начало месяца: имя секции}
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s AND p.relnamespace = current_schema()::regnamespace",
+        [table or DocumentHistory._meta.db_table]
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_RE.search(name)
+        if match:
+            month = datetime.datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=datetime.timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def create_partition(cursor, month, table=None):
+    """
+    Создает секцию месяца. Строки этого месяца из секции по умолчанию переносятся
+    в новую секцию до присоединения (иначе ATTACH завершится ошибкой)
+    """
+    table = table or DocumentHistory._meta.db_table
+    name = partition_name(month, table)
+    default = default_partition_name(table)
+    start, end = month, add_months(month, 1)
+
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM "{default}" WHERE created_at >= %s AND created_at < %s RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved',
+        [start, end]
+    )
+    cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return name
+
+
+def ensure_partitions(start=None, ahead=PARTITIONS_AHEAD):
+    """
+    Создает недостающие месячные секции от месяца start (по умолчанию текущего)
+    на ahead месяцев вперед. Возвращает имена созданных секций
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    first = month_start(start or datetime.datetime.now(datetime.timezone.utc))
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return []
+        existing = list_partitions(cursor)
+        for offset in range(ahead + 1):
+            month = add_months(first, offset)
+            if month not in existing:
+                created.append(create_partition(cursor, month))
+    return created
+
+
+def keyframe_dependents(cursor, name, after):
+    """
+    Переводит в опорные версии записи новее after, дельты которых опираются
+    на записи секции name: после отсоединения секции их базы станут недоступны.
+    Возвращает количество переведенных записей
+    """
+    table = DocumentHistory._meta.db_table
+    cursor.execute(
+        f'SELECT h.id FROM "{table}" h WHERE h.created_at >= %s AND h.changes ? %s '
+        f'AND (h.changes ->> %s)::bigint IN (SELECT id FROM "{name}")',
+        [after, 'delta', 'base']
+    )
+    dependent_ids = [row[0] for row in cursor.fetchall()]
+    if not dependent_ids:
+        return 0
+
+    keyframes = []
+    for entry in DocumentHistory.objects.filter(id__in=dependent_ids).only('id', 'document_id', 'changes'):
+        try:
+            keyframes.append(make_keyframe(entry, get_version_content(entry)))
+        except DocumentHistory.DoesNotExist as e:
+            # Цепочка уже прервана, восстанавливать нечего
+            logger.error(f"Не удалось перевести запись истории {entry.id} в опорную версию: {str(e)}")
+    DocumentHistory.objects.bulk_update(keyframes, ['changes'], batch_size=500)
+    return len(keyframes)
+
+
+def detach_partitions(before, drop=False):
+    """
+    Отсоединяет (и при drop=True удаляет) секции месяцев, закончившихся до before.
+    Записи более поздних месяцев, опирающиеся на отсоединяемые, предварительно
+    переводятся в опорные версии. Возвращает имена обработанных секций.
+
+    Каждый месяц обрабатывается в своей транзакции, а DETACH выполняется в ее конце:
+    блокировка ACCESS EXCLUSIVE на таблицу истории держится только до фиксации
+    этого месяца, а не на время перевода опорных версий по всем месяцам
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    table = DocumentHistory._meta.db_table
+    with connection.cursor() as cursor:
+        partitions = sorted(list_partitions(cursor).items())
+
+    processed = []
+    for month, name in partitions:
+        if add_months(month, 1) > before:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            keyframe_dependents(cursor, name, add_months(month, 1))
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            if drop:
+                cursor.execute(f'DROP TABLE "{name}"')
+        processed.append(name)
+    return processed
@@ -0,0 +1,190 @@
+"""
+Хранение и уплотнение истории документов.
+
+История пишется постоянно (просмотры раз в 30 минут на пользователя, версии
+содержимого), поэтому старые записи уплотняются по уровням:
+- моложе HISTORY_RETENTION_DAYS дней - все записи как есть;
+- старше - из версий содержимого (редактирования, изменения заголовка)
+  остается последняя за каждый час, а старше HISTORY_HOURLY_DAYS дней -
+  последняя за каждый день. Записи создания и прочие события не удаляются;
+- просмотры старше HISTORY_RETENTION_DAYS дней сворачиваются в дневные
+  счетчики DocumentActivityCounter и удаляются; общее число просмотров
+  (count_views) отдается в статистике документа.
+
+Оставленная версия, дельта которой ссылалась на удаляемую запись, становится
+опорной (полное содержимое), как и более новые записи с такой базой, поэтому
+все оставшиеся версии восстанавливаются.
+
+Документы обрабатываются по возрастанию ID пачками в отдельных транзакциях.
+Позиция сохраняется в MaintenanceCheckpoint после каждой пачки, следующий
+запуск продолжает с нее. Документ с прерванной цепочкой дельт пропускается
+(его изменения откатываются до точки сохранения), позиция при этом двигается дальше.
+"""
+import datetime
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DocumentHistory, DocumentActivityCounter, MaintenanceCheckpoint
+from .history import CONTENT_CHANGES, get_version_content, make_keyframe
+
+logger = logging.getLogger(__name__)
+
+# Сколько дней хранится вся история и с какого возраста версии остаются по одной в день
+HISTORY_RETENTION_DAYS = getattr(settings, 'DOCUMENTS_HISTORY_RETENTION_DAYS', 30)
+HISTORY_HOURLY_DAYS = getattr(settings, 'DOCUMENTS_HISTORY_HOURLY_DAYS', 180)
+
+CHECKPOINT_NAME = 'history-compaction'
+
+# Версии содержимого, которые прореживаются; создание документа остается всегда
+DOWNSAMPLED_ACTIONS = (DocumentHistory.ACTION_EDIT, DocumentHistory.ACTION_TITLE_CHANGE)
+
+
+def _bucket(created_at, daily_before):
+    """
+    Интервал прореживания записи: час для недавних, день для старых
+    """
+    if created_at < daily_before:
+        return created_at.date()
+    return created_at.replace(minute=0, second=0, microsecond=0)
+
+
+def compact_document_history(document_id, now=None):
+    """
+    Уплотняет историю одного документа. Возвращает счетчики
+    {'versions_deleted', 'keyframes', 'views_aggregated'}
+    """
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(days=HISTORY_RETENTION_DAYS)
+    daily_before = now - datetime.timedelta(days=HISTORY_HOURLY_DAYS)
+
+    # Последняя версия каждого интервала остается, остальные удаляются
+    old_versions = list(
+        DocumentHistory.objects.filter(
+            document_id=document_id,
+            action_type__in=DOWNSAMPLED_ACTIONS,
+            created_at__lt=cutoff,
+        ).order_by('created_at', 'id').values_list('id', 'created_at')
+    )
+    last_in_bucket = {}
+    for entry_id, created_at in old_versions:
+        last_in_bucket[_bucket(created_at, daily_before)] = entry_id
+    kept = set(last_in_bucket.values())
+    deleted = [entry_id for entry_id, _ in old_versions if entry_id not in kept]
+
+    keyframes = []
+    if deleted:
+        # Записи, чья дельта опирается на удаляемые, переводятся в полные версии
+        # до удаления: их содержимое восстанавливается по еще существующей цепочке
+        dependents = DocumentHistory.objects.filter(
+            CONTENT_CHANGES,
+            document_id=document_id,
+            changes__base__in=deleted,
+        ).exclude(id__in=deleted).only('id', 'document_id', 'changes')
+        keyframes = [make_keyframe(entry, get_version_content(entry)) for entry in dependents]
+        if keyframes:
+            DocumentHistory.objects.bulk_update(keyframes, ['changes'])
+        DocumentHistory.objects.filter(id__in=deleted).delete()
+
+    # Старые просмотры сворачиваются в дневные счетчики
+    views = DocumentHistory.objects.filter(
+        document_id=document_id,
+        action_type=DocumentHistory.ACTION_VIEW,
+        created_at__lt=cutoff,
+    )
+    daily = {
+        row['day']: row['count']
+        for row in views.annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('id')).order_by()
+    }
+    if daily:
+        existing = {
+            counter.date: counter
+            for counter in DocumentActivityCounter.objects.filter(
+                document_id=document_id, action_type=DocumentHistory.ACTION_VIEW, date__in=list(daily)
+            )
+        }
+        for day, count in daily.items():
+            counter = existing.get(day)
+            if counter is None:
+                existing[day] = DocumentActivityCounter(
+                    document_id=document_id, date=day, action_type=DocumentHistory.ACTION_VIEW, count=count
+                )
+            else:
+                counter.count += count
+        DocumentActivityCounter.objects.bulk_create(
+            list(existing.values()),
+            update_conflicts=True,
+            unique_fields=['document', 'date', 'action_type'],
+            update_fields=['count'],
+        )
+        views.delete()
+
+    return {
+        'versions_deleted': len(deleted),
+        'keyframes': len(keyframes),
+        'views_aggregated': sum(daily.values()),
+    }
+
+
+def count_views(document_id):
+    """
+    Просмотры документа за все время: записи истории и дневные счетчики,
+    в которые свернуты старые просмотры
+    """
+    recent = DocumentHistory.objects.filter(document_id=document_id, action_type=DocumentHistory.ACTION_VIEW).count()
+    aggregated = DocumentActivityCounter.objects.filter(
+        document_id=document_id, action_type=DocumentHistory.ACTION_VIEW
+    ).aggregate(total=Sum('count'))['total']
+    return recent + (aggregated or 0)
+
+
+def iter_compaction(batch_size=100, max_documents=None, now=None):
+    """
+    Уплотняет историю документов пачками от сохраненной позиции.
+    Отдает после каждой пачки {'position', 'documents', итоговые счетчики}.
+    Пройдя все документы, сбрасывает позицию, чтобы следующий запуск начал сначала
+    """
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(days=HISTORY_RETENTION_DAYS)
+    MaintenanceCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+
+    totals = {'documents': 0, 'versions_deleted': 0, 'keyframes': 0, 'views_aggregated': 0, 'skipped': 0}
+    while max_documents is None or totals['documents'] < max_documents:
+        limit = batch_size if max_documents is None else min(batch_size, max_documents - totals['documents'])
+
+        with transaction.atomic():
+            # Блокировка позиции не дает двум запускам обрабатывать одни и те же документы
+            checkpoint = MaintenanceCheckpoint.objects.select_for_update().get(name=CHECKPOINT_NAME)
+            document_ids = list(
+                DocumentHistory.objects.filter(
+                    document_id__gt=checkpoint.position,
+                    created_at__lt=cutoff,
+                ).order_by('document_id').values_list('document_id', flat=True).distinct()[:limit]
+            )
+            if not document_ids:
+                checkpoint.position = 0
+                checkpoint.save(update_fields=['position', 'updated_at'])
+                return totals
+
+            for document_id in document_ids:
+                try:
+                    # Точка сохранения: ошибка одного документа не откатывает всю пачку
+                    with transaction.atomic():
+                        counters = compact_document_history(document_id, now=now)
+                except DocumentHistory.DoesNotExist as e:
+                    # Цепочка дельт прервана: документ пропускается, позиция двигается дальше
+                    logger.error(f"Уплотнение истории документа {document_id} пропущено: {str(e)}")
+                    totals['skipped'] += 1
+                    continue
+                for key, value in counters.items():
+                    totals[key] += value
+
+            checkpoint.position = document_ids[-1]
+            checkpoint.save(update_fields=['position', 'updated_at'])
+
+        totals['documents'] += len(document_ids)
+        yield {'position': checkpoint.position, **totals}
+
+    return totals
@@ -0,0 +1,35 @@
+"""
+Полнотекстовый поиск по документам (PostgreSQL tsvector).
+
+В Document.plain_text хранится простой текст блоков EditorJS, а в
+Document.search_vector - tsvector из заголовка (вес A) и текста (вес B)
+с GIN-индексом. Оба поля пересчитываются при каждой записи содержимого
+или заголовка (documents.derived), поэтому поиск не разбирает JSON.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+
+# Конфигурация текстового поиска PostgreSQL (словарь и стемминг)
+SEARCH_CONFIG = getattr(settings, 'DOCUMENTS_SEARCH_CONFIG', 'russian')
+
+# Маркеры подсветки совпадений во фрагментах результатов
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+
+def document_search_vector(title='title', plain_text='plain_text'):
+    """
+    Выражение tsvector документа. По умолчанию строится по колонкам,
+    вместо них можно передать значения (Value)
+    """
+    return (
+        SearchVector(title, weight='A', config=SEARCH_CONFIG)
+        + SearchVector(plain_text, weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(queryset):
+    """
+    Пересчитывает поисковые векторы по уже сохраненным plain_text (для пакетных вставок)
+    """
+    return queryset.update(search_vector=document_search_vector())
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import Document, AccessRight, DocumentHistory
+from .fieldsets import SparseFieldsetMixin
+from .history import get_version_content
 from django.contrib.auth import get_user_model
 import json
 import logging
@@ -9,18 +11,41 @@ logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Базовый сериализатор для документов
     """
     owner_username = serializers.ReadOnlyField(source='owner.username')
+    has_children = serializers.BooleanField(read_only=True)
+    descendants_count = serializers.IntegerField(source='get_descendant_count', read_only=True)
     
     class Meta:
         model = Document
-        fields = ['id', 'title', 'created_at', 'updated_at', 'owner', 'owner_username', 'parent', 'is_favorite']
-        read_only_fields = ['owner', 'created_at', 'updated_at']
+        fields = ['id', 'title', 'created_at', 'updated_at', 'owner', 'owner_username', 'parent', 'position', 'is_favorite', 'has_children', 'descendants_count', 'trashed_at']
+        read_only_fields = ['owner', 'created_at', 'updated_at', 'position', 'trashed_at']
 
-class DocumentDetailSerializer(serializers.ModelSerializer):
+class DocumentSearchSerializer(DocumentSerializer):
+    """
+    Сериализатор результата полнотекстового поиска: релевантность и фрагмент с подсветкой
+    """
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+    
+    class Meta(DocumentSerializer.Meta):
+        fields = DocumentSerializer.Meta.fields + ['rank', 'snippet']
+
+class DocumentTreeSerializer(serializers.ModelSerializer):
+    """
+    Компактный сериализатор узла дерева документов (без содержимого)
+    """
+    has_children = serializers.BooleanField(read_only=True)
+    
+    class Meta:
+        model = Document
+        fields = ['id', 'title', 'parent', 'position', 'level', 'is_favorite', 'is_root', 'has_children']
+        read_only_fields = fields
+
+class DocumentDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Детальный сериализатор для документа, включающий содержимое
     """
@@ -28,29 +53,29 @@ class DocumentDetailSerializer(serializers.ModelSerializer):
     children = DocumentSerializer(many=True, read_only=True)
     path = serializers.SerializerMethodField()
     is_root = serializers.SerializerMethodField()
+    has_children = serializers.BooleanField(read_only=True)
+    descendants_count = serializers.IntegerField(source='get_descendant_count', read_only=True)
     
     def get_path(self, obj):
         """
-        Получает путь к документу в древовидной структуре
+        Получает путь к документу в древовидной структуре.
+        Все предки выбираются одним запросом по границам MPTT, от корня к документу
         """
-        ancestors = []
-        parent = obj.parent
+        ancestors = obj.get_ancestors().only('id', 'title', 'lft', 'rght', 'tree_id', 'level')
         
-        # Строим путь от корня к текущему документу
-        while parent:
-            ancestors.insert(0, {
-                'id': str(parent.id),
-                'title': parent.title
-            })
-            parent = parent.parent
-        
-        return ancestors
+        return [
+            {
+                'id': str(ancestor.id),
+                'title': ancestor.title
+            }
+            for ancestor in ancestors
+        ]
     
     def get_is_root(self, obj):
         """
-        Проверяет, является ли документ корневым
+        Проверяет, является ли документ корневым (без загрузки родителя)
         """
-        return obj.parent is None
+        return obj.parent_id is None
     
     def to_representation(self, instance):
         """
@@ -60,11 +85,13 @@ class DocumentDetailSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         
         # Логируем информацию о поле content перед отправкой клиенту
-        logger.info(f"TO_REPRESENTATION (Document ID: {instance.id}): content тип {type(instance.content)}, пустой: {not bool(instance.content)}")
-        
-        # Если content - пустой словарь, проверим исходный объект
-        if isinstance(instance.content, dict) and not instance.content:
-            logger.warning(f"Пустой словарь content для Document ID: {instance.id}")
+        # (если content не запрошен, он не загружен из БД, и обращаться к нему не нужно)
+        if 'content' in self.fields:
+            logger.info(f"TO_REPRESENTATION (Document ID: {instance.id}): content тип {type(instance.content)}, пустой: {not bool(instance.content)}")
+            
+            # Если content - пустой словарь, проверим исходный объект
+            if isinstance(instance.content, dict) and not instance.content:
+                logger.warning(f"Пустой словарь content для Document ID: {instance.id}")
         
         return representation
     
@@ -130,8 +157,8 @@ class DocumentDetailSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Document
-        fields = ['id', 'title', 'content', 'created_at', 'updated_at', 'owner', 'owner_username', 'parent', 'children', 'is_favorite', 'path', 'is_root']
-        read_only_fields = ['owner', 'created_at', 'updated_at', 'path', 'is_root']
+        fields = ['id', 'title', 'content', 'created_at', 'updated_at', 'owner', 'owner_username', 'parent', 'position', 'children', 'is_favorite', 'path', 'is_root', 'has_children', 'descendants_count']
+        read_only_fields = ['owner', 'created_at', 'updated_at', 'position', 'path', 'is_root']
 
 class UserBasicSerializer(serializers.ModelSerializer):
     """
@@ -188,13 +215,34 @@ class AccessRightSerializer(serializers.ModelSerializer):
 
 class DocumentHistorySerializer(serializers.ModelSerializer):
     """
-    Сериализатор для истории изменений документа
+    Сериализатор для ленты истории изменений документа.
+    changes - краткие изменения без версии содержимого (queryset из history.summary_queryset),
+    has_content - у записи есть версия, которую можно получить отдельно
     """
     user_details = UserBasicSerializer(source='user', read_only=True)
     action_label = serializers.CharField(source='get_action_type_display', read_only=True)
     document_title = serializers.CharField(source='document.title', read_only=True)
+    changes = serializers.JSONField(source='summary', read_only=True)
+    has_content = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = DocumentHistory
-        fields = ['id', 'document', 'document_title', 'user', 'user_details', 'changes', 'action_type', 'action_label', 'created_at']
-        read_only_fields = ['created_at'] 
\ No newline at end of file
+        fields = ['id', 'document', 'document_title', 'user', 'user_details', 'changes', 'has_content', 'action_type', 'action_label', 'created_at']
+        read_only_fields = ['created_at']
+
+class DocumentHistoryVersionSerializer(DocumentHistorySerializer):
+    """
+    Запись истории вместе с содержимым документа в ее версии
+    """
+    content = serializers.SerializerMethodField()
+    
+    class Meta(DocumentHistorySerializer.Meta):
+        fields = DocumentHistorySerializer.Meta.fields + ['content']
+    
+    def get_content(self, obj):
+        try:
+            return get_version_content(obj)
+        except DocumentHistory.DoesNotExist as e:
+            # Цепочка дельт прервана (например, буфер истории потерян при сбое)
+            logger.error(f"Не удалось восстановить версию истории {obj.pk}: {str(e)}")
+            return None
@@ -0,0 +1,459 @@
+"""
+Служебные функции для изменения структуры дерева документов.
+
+Все изменения MPTT (создание, перемещение, удаление) внутри одного дерева
+(tree_id) выполняются под advisory-блокировкой PostgreSQL уровня транзакции.
+Изменения в разных рабочих пространствах при этом идут параллельно.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Document, DocumentHistory
+from .ordering import key_after, key_between
+from .content import remap_nested_documents, derive_content
+from .search import refresh_search_vectors
+from .cache import invalidate_trees
+from .access import refresh_subtree_access
+
+# Пространство ключей advisory-блокировок для деревьев документов
+TREE_LOCK_NAMESPACE = 7301
+
+# Условный tree_id для блокировки выделения нового дерева (реальные tree_id начинаются с 1)
+NEW_TREE_LOCK_ID = 0
+
+# Поля MPTT, которые нужно перечитать после получения блокировки
+TREE_FIELDS = ['tree_id', 'lft', 'rght', 'level']
+
+
+def lock_trees(*tree_ids):
+    """
+    Захватывает блокировки деревьев до конца текущей транзакции.
+    Деревья блокируются по возрастанию tree_id, чтобы не возникало взаимных блокировок
+    """
+    if not connection.in_atomic_block:
+        raise RuntimeError("Блокировка дерева возможна только внутри transaction.atomic()")
+
+    # Advisory-блокировки есть только в PostgreSQL
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        for tree_id in sorted(set(tree_ids)):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [TREE_LOCK_NAMESPACE, tree_id])
+
+
+def lock_document_trees(*documents, new_tree=False):
+    """
+    Блокирует деревья переданных документов и перечитывает их поля MPTT.
+    new_tree=True дополнительно блокирует выделение нового tree_id.
+    Если пока ждали блокировку документ перенесли в другое дерево, захваченные
+    блокировки снимаются откатом к точке сохранения и весь набор деревьев
+    захватывается заново по возрастанию tree_id, как того требует lock_trees
+    """
+    documents = [document for document in documents if document is not None]
+    target = {document.tree_id for document in documents}
+    if new_tree:
+        target.add(NEW_TREE_LOCK_ID)
+
+    while True:
+        savepoint = transaction.savepoint()
+        lock_trees(*target)
+
+        for document in documents:
+            document.refresh_from_db(fields=TREE_FIELDS)
+        moved = {document.tree_id for document in documents} - target
+        if not moved:
+            transaction.savepoint_commit(savepoint)
+            return target
+
+        # Откат к точке сохранения освобождает advisory-блокировки, взятые после нее
+        transaction.savepoint_rollback(savepoint)
+        target |= moved
+
+
+def get_sibling_positions(parent, count=1, after=None, before=None, exclude_ids=()):
+    """
+    Вычисляет ключи порядка для count документов, встающих подряд среди дочерних документов parent.
+    after/before - соседи, между которыми нужно встать; без них документы добавляются в конец.
+    Ключи остальных соседей не меняются
+    """
+    siblings = Document.objects.filter(parent=parent).exclude(pk__in=exclude_ids)
+
+    if after is not None and before is not None:
+        left, right = after.position, before.position
+    elif after is not None:
+        left = after.position
+        right = siblings.filter(position__gt=left).order_by('position').values_list('position', flat=True).first()
+    elif before is not None:
+        right = before.position
+        left = siblings.filter(position__lt=right).order_by('-position').values_list('position', flat=True).first()
+    else:
+        left = siblings.order_by('-position').values_list('position', flat=True).first()
+        right = None
+
+    positions = []
+    left = left or None
+    for _ in range(count):
+        left = key_between(left, right)
+        positions.append(left)
+
+    return positions
+
+
+def get_sibling_position(parent, after=None, before=None, exclude=None):
+    """
+    Вычисляет ключ порядка для одного документа среди дочерних документов parent
+    """
+    exclude_ids = [exclude.pk] if exclude is not None else ()
+    return get_sibling_positions(parent, 1, after=after, before=before, exclude_ids=exclude_ids)[0]
+
+
+def reserve_document_ids(count):
+    """
+    Резервирует count значений первичного ключа документов одним запросом к последовательности.
+    Зная ID заранее, можно вставить целое поддерево одним bulk_create
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [Document._meta.db_table, count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def iter_nodes(nodes):
+    """
+    Обходит вложенную структуру [{title, content, children}, ...] в прямом порядке
+    """
+    for node in nodes:
+        yield node
+        yield from iter_nodes(node.get('children', []))
+
+
+def count_nodes(nodes):
+    """
+    Считает узлы во вложенной структуре [{title, content, children}, ...]
+    """
+    return sum(1 for _ in iter_nodes(nodes))
+
+
+def copy_subtree_nodes(document):
+    """
+    Читает поддерево документа одним запросом и возвращает его копию во вложенной
+    структуре для iter_insert_subtrees. ID копий резервируются заранее, поэтому ссылки
+    на вложенные документы в содержимом сразу указывают на новые документы
+    """
+    rows = list(
+        document.get_descendants(include_self=True)
+        .filter(is_trashed=False)
+        .order_by('lft')
+        .values('id', 'parent_id', 'title', 'content')
+    )
+    new_ids = reserve_document_ids(len(rows))
+    id_map = {str(row['id']): new_id for row, new_id in zip(rows, new_ids)}
+
+    nodes = {}
+    for row, new_id in zip(rows, new_ids):
+        node = {
+            'id': new_id,
+            'title': row['title'],
+            'content': remap_nested_documents(row['content'], id_map),
+            'children': [],
+        }
+        nodes[row['id']] = node
+        # Строки идут по lft, поэтому родитель всегда уже обработан, а дети - в порядке соседей
+        if row['id'] != document.id:
+            nodes[row['parent_id']]['children'].append(node)
+
+    return [nodes[document.id]]
+
+
+def iter_insert_subtrees(nodes, owner, user, parent=None, after=None, batch_size=500):
+    """
+    Вставляет вложенную структуру документов [{title, content, children}, ...] пачками.
+
+    Документы встают последними детьми parent или сразу после соседа after.
+    Поля MPTT вычисляются заранее (TreeManager.build_tree_nodes), поэтому на каждое
+    поддерево верхнего уровня приходится один сдвиг lft/rght и несколько bulk_create.
+    Вызывать внутри transaction.atomic() с заблокированным деревом.
+
+    Генератор отдает прогресс {'created': n, 'total': N}, а через StopIteration.value
+    возвращает созданные документы верхнего уровня
+    """
+    total = count_nodes(nodes)
+
+    # ID резервируются только для узлов, у которых их еще нет
+    missing = sum(1 for node in iter_nodes(nodes) if node.get('id') is None)
+    ids = iter(reserve_document_ids(missing) if missing else [])
+
+    if after is not None and after.parent_id is None:
+        # Рядом с документом верхнего уровня создаются новые деревья
+        after = None
+    if after is not None:
+        parent = after.parent
+    if parent is not None:
+        top_positions = get_sibling_positions(parent, len(nodes), after=after)
+    else:
+        # У документов верхнего уровня ключ порядка пустой
+        top_positions = [''] * len(nodes)
+
+    def build(node, parent_id, position):
+        document_id = node.get('id') or next(ids)
+        content = node.get('content') or {}
+        children = []
+        child_position = None
+        for child in node.get('children', []):
+            child_position = key_after(child_position)
+            children.append(build(child, document_id, child_position))
+        return {
+            'id': document_id,
+            'parent_id': parent_id,
+            'owner': owner,
+            'title': node['title'],
+            'content': content,
+            **derive_content(content),
+            'position': position,
+            'children': children,
+        }
+
+    created = 0
+    top_documents = []
+    target, target_position = (after, 'right') if after is not None else (parent, 'last-child')
+
+    for node, position in zip(nodes, top_positions):
+        data = build(node, parent.pk if parent is not None else None, position)
+
+        # build_tree_nodes сразу освобождает место в дереве одним UPDATE
+        records = Document.objects.build_tree_nodes(data, target=target, position=target_position)
+        top_documents.append(records[0])
+
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            Document.objects.bulk_create(batch)
+            refresh_search_vectors(Document.objects.filter(pk__in=[document.pk for document in batch]))
+            DocumentHistory.objects.bulk_create([
+                DocumentHistory(
+                    document=document,
+                    user=user,
+                    action_type=DocumentHistory.ACTION_CREATE,
+                    changes={
+                        'content': document.content,
+                        'user_id': user.id,
+                        'username': user.username,
+                        'title': document.title
+                    }
+                )
+                for document in batch
+            ])
+            created += len(batch)
+            yield {'created': created, 'total': total}
+
+        if parent is not None:
+            # Права на предков с include_children действуют и на новое поддерево
+            refresh_subtree_access(records[0])
+
+        # Следующее поддерево встает справа от только что вставленного
+        if target is not None:
+            target, target_position = records[0], 'right'
+
+    if parent is not None:
+        DocumentHistory.objects.bulk_create([
+            DocumentHistory(
+                document=parent,
+                user=user,
+                action_type=DocumentHistory.ACTION_NESTED_CREATE,
+                changes={
+                    'nested_document_id': str(document.id),
+                    'nested_document_title': document.title,
+                    'user_id': user.id,
+                    'username': user.username,
+                    'is_nested': True
+                }
+            )
+            for document in top_documents
+        ])
+
+    return top_documents
+
+
+def insert_subtrees(nodes, owner, user, parent=None, after=None):
+    """
+    Вставляет вложенную структуру документов целиком и возвращает документы верхнего уровня
+    """
+    steps = iter_insert_subtrees(nodes, owner, user, parent=parent, after=after)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def subtree_queryset(document):
+    """
+    Документы поддерева (включая сам документ), выбранные по границам MPTT
+    """
+    return Document.objects.filter(
+        tree_id=document.tree_id,
+        lft__gte=document.lft,
+        rght__lte=document.rght
+    )
+
+
+def get_ancestor_paths(documents):
+    """
+    Пути от корня к документам [{id, title}, ...] одним запросом для всего списка.
+    Документы должны содержать поля tree_id, lft и rght
+    """
+    documents = list(documents)
+    if not documents:
+        return {}
+    
+    condition = Q()
+    for document in documents:
+        condition |= Q(tree_id=document.tree_id, lft__lt=document.lft, rght__gt=document.rght)
+    ancestors = list(
+        Document.objects.filter(condition)
+        .order_by('tree_id', 'lft')
+        .only('id', 'title', 'tree_id', 'lft', 'rght')
+    )
+    
+    return {
+        document.pk: [
+            {'id': str(ancestor.id), 'title': ancestor.title}
+            for ancestor in ancestors
+            if ancestor.tree_id == document.tree_id and ancestor.lft < document.lft and ancestor.rght > document.rght
+        ]
+        for document in documents
+    }
+
+
+def trash_subtree(document):
+    """
+    Перемещает поддерево в корзину одним UPDATE по диапазону lft/rght.
+    Уже удаленные ранее документы поддерева сохраняют свою метку времени
+    """
+    now = timezone.now()
+    count = subtree_queryset(document).filter(is_trashed=False).update(is_trashed=True, trashed_at=now)
+    document.is_trashed = True
+    document.trashed_at = now
+    return count
+
+
+def restore_subtree(document):
+    """
+    Восстанавливает из корзины документы, удаленные вместе с document (по совпадению trashed_at)
+    """
+    count = subtree_queryset(document).filter(
+        is_trashed=True,
+        trashed_at=document.trashed_at
+    ).update(is_trashed=False, trashed_at=None)
+    document.is_trashed = False
+    document.trashed_at = None
+    return count
+
+
+def trash_roots():
+    """
+    Документы, удаленные в корзину напрямую (а не вместе с удаленным родителем)
+    """
+    return Document.objects.filter(is_trashed=True).exclude(
+        parent__is_trashed=True,
+        parent__trashed_at=F('trashed_at')
+    )
+
+
+def purge_subtree(document, batch_size=500):
+    """
+    Физически удаляет поддерево из корзины.
+
+    Потомки удаляются пачками от самых глубоких уровней, каждая пачка - в своей
+    короткой транзакции. Затем удаляется сам документ и одним сдвигом закрывается
+    промежуток в границах дерева. Возвращает количество удаленных документов
+    """
+    deleted = 0
+
+    while True:
+        with transaction.atomic():
+            lock_document_trees(document)
+            ids = list(
+                subtree_queryset(document)
+                .filter(lft__gt=document.lft)
+                .order_by('-level')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            # Каскадно удаляются история, права доступа и задачи этих документов
+            Document.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+
+    with transaction.atomic():
+        lock_document_trees(document)
+        width = document.rght - document.lft + 1
+        right = document.rght
+        tree_id = document.tree_id
+
+        deleted += subtree_queryset(document).count()
+        subtree_queryset(document).delete()
+
+        # Закрываем промежуток, оставшийся после удаленного поддерева
+        Document.objects.filter(tree_id=tree_id, lft__gt=right).update(lft=F('lft') - width)
+        Document.objects.filter(tree_id=tree_id, rght__gt=right).update(rght=F('rght') - width)
+        invalidate_trees(tree_id)
+
+    return deleted
+
+
+def verify_tree(tree_id):
+    """
+    Проверяет согласованность полей MPTT одного дерева.
+    Возвращает список найденных ошибок (пустой, если дерево корректно)
+    """
+    nodes = list(
+        Document.objects.filter(tree_id=tree_id)
+        .order_by()
+        .values_list('id', 'parent_id', 'lft', 'rght', 'level')
+    )
+    errors = []
+    if not nodes:
+        return errors
+
+    by_id = {node[0]: node for node in nodes}
+
+    roots = [node for node in nodes if node[1] is None]
+    if len(roots) != 1:
+        errors.append(f"Корневых документов в дереве: {len(roots)}")
+
+    # Границы всех узлов должны образовывать последовательность 1..2N без пропусков и повторов
+    bounds = sorted(value for node in nodes for value in (node[2], node[3]))
+    if bounds != list(range(1, 2 * len(nodes) + 1)):
+        errors.append("Границы lft/rght не образуют непрерывную последовательность")
+
+    for document_id, parent_id, lft, rght, level in nodes:
+        if lft >= rght:
+            errors.append(f"Документ {document_id}: lft={lft} не меньше rght={rght}")
+
+        if parent_id is None:
+            if level != 0:
+                errors.append(f"Документ {document_id}: корневой документ на уровне {level}")
+            continue
+
+        parent = by_id.get(parent_id)
+        if parent is None:
+            errors.append(f"Документ {document_id}: родитель {parent_id} находится в другом дереве")
+        elif not (parent[2] < lft and rght < parent[3]):
+            errors.append(f"Документ {document_id}: границы выходят за пределы родителя {parent_id}")
+        elif level != parent[4] + 1:
+            errors.append(f"Документ {document_id}: уровень {level} не соответствует родителю {parent_id}")
+
+    return errors
+
+
+def rebuild_tree(tree_id):
+    """
+    Перестраивает поля MPTT одного дерева по ссылкам на родителей под блокировкой дерева
+    """
+    with transaction.atomic():
+        lock_trees(tree_id)
+        Document.objects.partial_rebuild(tree_id)
+        invalidate_trees(tree_id)
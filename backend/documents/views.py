@@ -1,35 +1,115 @@
 from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse, Http404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Count
-from django.db import connection
+from django.db.models import Q, F, Count, Sum, Prefetch, FloatField
+from django.db.models.functions import Cast
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchHeadline, TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connection, transaction
 from .models import Document, AccessRight, DocumentHistory
-from .serializers import DocumentSerializer, DocumentDetailSerializer, AccessRightSerializer, DocumentHistorySerializer
+from .tree import (
+    lock_document_trees, get_sibling_positions, get_sibling_position, TREE_FIELDS,
+    insert_subtrees, iter_insert_subtrees, count_nodes, copy_subtree_nodes,
+    trash_subtree, restore_subtree, trash_roots, get_ancestor_paths, subtree_queryset
+)
+from .access import (
+    sync_access_right, refresh_subtree_access, has_role, can_view, editable_documents
+)
+from .visibility import visible_documents, shared_documents
+from .activity import record_view, record_edit
+from .history import CONTENT_CHANGES, summary_queryset, subtree_activity_queryset, with_summary, get_version_content
+from .diff import get_versions_diff
+from .retention import count_views
+from .search import SEARCH_CONFIG, HIGHLIGHT_START, HIGHLIGHT_STOP
+from .derived import update_derived_content
+from .pagination import KeysetPagination, DocumentPagination
+from .fieldsets import restrict_queryset
+from .conditional import fingerprint, conditional_response
+from .cache import (
+    get_versions, detail_cache_key, get_cached_detail, set_cached_detail,
+    invalidate_documents, invalidate_trees, get_document
+)
+from .serializers import DocumentSerializer, DocumentDetailSerializer, DocumentTreeSerializer, DocumentSearchSerializer, AccessRightSerializer, DocumentHistorySerializer, DocumentHistoryVersionSerializer
+import asyncio
+import hashlib
 import json
 import logging
 import copy
 import datetime
-import re
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
+# Глубина поддерева, отдаваемая эндпоинтом tree по умолчанию и максимально
+TREE_DEFAULT_DEPTH = 2
+TREE_MAX_DEPTH = 10
+
+# Максимальное количество документов в одном запросе пакетного создания
+BULK_CREATE_MAX_DOCUMENTS = 5000
+
+# Количество подсказок автодополнения по умолчанию и максимально, время кэширования (сек)
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 20
+AUTOCOMPLETE_CACHE_TIMEOUT = 15
+
 def get_access(user, document, required_roles):
     """
     Функция проверяет, имеет ли пользователь указанные права доступа к документу
     """
     # Если пользователь - владелец, у него есть все права
-    if document.owner == user:
+    if document.owner_id == user.pk:
         return True
     
-    # Проверяем, есть ли у пользователя требуемые права
-    access_right = AccessRight.objects.filter(document=document, user=user).first()
-    if access_right and access_right.role in required_roles:
-        return True
+    # Права на документ или унаследованные от предка (include_children)
+    return has_role(user, document, required_roles)
+
+def normalize_document_nodes(items, limit):
+    """
+    Проверяет вложенную структуру [{title, content, children}, ...] для пакетного создания
+    и приводит content к словарю. При ошибке выбрасывает ValueError
+    """
+    count = 0
+    
+    def normalize(items, path):
+        nonlocal count
+        if not isinstance(items, list):
+            raise ValueError(f"{path}: ожидается список документов")
+        
+        result = []
+        for index, item in enumerate(items):
+            item_path = f"{path}[{index}]"
+            if not isinstance(item, dict):
+                raise ValueError(f"{item_path}: ожидается объект документа")
+            
+            count += 1
+            if count > limit:
+                raise ValueError(f"За один запрос можно создать не более {limit} документов")
+            
+            title = item.get('title')
+            if not isinstance(title, str) or not title.strip() or len(title) > 255:
+                raise ValueError(f"{item_path}.title: заголовок обязателен и не длиннее 255 символов")
+            
+            content = item.get('content') or {}
+            if isinstance(content, str):
+                try:
+                    content = json.loads(content)
+                except json.JSONDecodeError:
+                    raise ValueError(f"{item_path}.content: некорректный JSON")
+            if not isinstance(content, dict):
+                raise ValueError(f"{item_path}.content: ожидается объект EditorJS")
+            
+            result.append({
+                'title': title,
+                'content': content,
+                'children': normalize(item.get('children', []), f"{item_path}.children")
+            })
+        return result
     
-    return False
+    return normalize(items, 'documents')
 
 class DocumentViewSet(viewsets.ModelViewSet):
     """
@@ -37,6 +117,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
     """
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
+    pagination_class = DocumentPagination
     
     def get_permissions(self):
         """
@@ -63,22 +144,94 @@ class DocumentViewSet(viewsets.ModelViewSet):
         root = self.request.query_params.get('root', None)
         if root and root.lower() == 'true':
             # Сначала проверяем, есть ли документы с явным флагом is_root=True
-            root_docs = Document.objects.filter(owner=user, is_root=True)
+            root_docs = Document.objects.filter(owner=user, is_root=True, is_trashed=False).select_related('owner')
             if root_docs.exists():
                 # Возвращаем документы с флагом is_root=True
-                return root_docs
+                return self.restrict_fields(root_docs)
             
             # Если таких нет, возвращаем документы с parent=None
-            return Document.objects.filter(owner=user, parent=None).order_by('id')
+            return self.restrict_fields(
+                Document.objects.filter(owner=user, parent=None, is_trashed=False).select_related('owner').order_by('id')
+            )
+        
+        # Собственные документы и доступные по правам (EXISTS, без JOIN и DISTINCT);
+        # владельца подгружаем сразу, чтобы owner_username не порождал отдельный запрос на каждый документ
+        queryset = visible_documents(user).select_related('owner')
+        
+        # Документы из корзины видны только при восстановлении
+        if self.action != 'restore':
+            queryset = queryset.filter(is_trashed=False)
+        
+        if self.action == 'retrieve':
+            # Дочерние документы для детального представления - одним запросом
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'children',
+                    queryset=Document.objects.filter(is_trashed=False).select_related('owner').defer('content')
+                )
+            )
         
-        # Документы, которые пользователь создал
-        own_documents = Q(owner=user)
+        return self.restrict_fields(queryset)
+    
+    def restrict_fields(self, queryset, serializer_class=None):
+        """
+        Для чтения списков и документа загружает только колонки, попадающие в ответ
+        (параметры fields/omit); изменяющие действия получают модель целиком
+        """
+        if self.action not in ('list', 'retrieve', 'favorites', 'shared_with_me', 'search', 'tree', 'statistics'):
+            return queryset
+        return restrict_queryset(queryset, serializer_class or self.get_serializer_class(), self.request)
+    
+    def get_cached_object(self):
+        """
+        Документ для чтения из кэша объектов (без запроса к таблице документов).
+        Доступ проверяется так же, как в get_queryset: владелец или право доступа,
+        документы из корзины не отдаются. Изменяющие действия используют get_object
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            document = get_document(self.kwargs[lookup_url_kwarg])
+        except Document.DoesNotExist:
+            raise Http404
         
-        # Документы, к которым у пользователя есть доступ
-        access_documents = Q(access_rights__user=user)
+        user = self.request.user
+        if document.is_trashed:
+            raise Http404
+        if not can_view(user, document):
+            raise Http404
         
-        # Объединяем и исключаем дубликаты
-        return Document.objects.filter(own_documents | access_documents).distinct()
+        self.check_object_permissions(self.request, document)
+        return document
+    
+    def paginate_queryset(self, queryset):
+        """
+        Корневые документы (root=true) отдаются списком без пагинации:
+        их единицы, и клиент выбирает среди них основное рабочее пространство
+        """
+        root = self.request.query_params.get('root', None)
+        if root and root.lower() == 'true':
+            return None
+        return super().paginate_queryset(queryset)
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Список документов с условным GET: при неизменном наборе документов - 304
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return conditional_response(
+            request, fingerprint(queryset),
+            lambda: super(DocumentViewSet, self).list(request, *args, **kwargs)
+        )
+    
+    def get_paginated_action_response(self, queryset, ordering, serializer_class=None, page_size=None):
+        """
+        Курсорная страница для дополнительных действий (ordering - поля сортировки с уникальным последним)
+        """
+        paginator = KeysetPagination(ordering=ordering, page_size=page_size)
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer_class = serializer_class or self.get_serializer_class()
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def favorites(self, request):
@@ -90,14 +243,14 @@ class DocumentViewSet(viewsets.ModelViewSet):
         # Получаем документы, отмеченные как избранные для текущего пользователя
         favorite_docs = Document.objects.filter(
             owner=user,
-            is_favorite=True
-        ).order_by('title')
+            is_favorite=True,
+            is_trashed=False
+        ).select_related('owner')
         
-        logger.info(f"Получены избранные документы для пользователя {user.id}, найдено: {favorite_docs.count()}")
+        logger.info(f"Получение избранных документов для пользователя {user.id}")
         
         # Используем базовый сериализатор для списка документов
-        serializer = self.get_serializer(favorite_docs, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_action_response(self.restrict_fields(favorite_docs), ('title', 'id'))
     
     @action(detail=True, methods=['post'])
     def toggle_favorite(self, request, pk=None):
@@ -106,7 +259,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
         """
         document = self.get_object()
         document.is_favorite = not document.is_favorite
-        document.save()
+        document.save(update_fields=['is_favorite', 'updated_at'])
+        
+        # Флаг избранного виден в списке children родителя
+        invalidate_trees(document.tree_id)
         
         # Логируем действие
         action_type = "добавлен в избранное" if document.is_favorite else "удален из избранного"
@@ -118,23 +274,79 @@ class DocumentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def search(self, request):
         """
-        Поиск документов по названию
+        Полнотекстовый поиск по заголовкам и тексту документов.
+        Запрос разбирается как в поисковых системах (websearch: "фраза", -исключение, or),
+        результаты упорядочены по релевантности и листаются курсором
         """
-        query = request.query_params.get('q', '')
+        query = request.query_params.get('q', '').strip()
         if not query:
-            return Response([])
+            return Response({'next': None, 'next_cursor': None, 'results': []})
         
-        # Поиск документов по названию
         user = request.user
-        found_docs = Document.objects.filter(
-            Q(owner=user) | Q(access_rights__user=user),
-            title__icontains=query
-        ).distinct().order_by('title')
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        found_docs = visible_documents(user).filter(
+            search_vector=search_query,
+            is_trashed=False
+        ).select_related('owner').annotate(
+            # ts_rank возвращает real; приводим к double, чтобы значение в курсоре
+            # совпадало со значением в БД при сравнении
+            rank=Cast(SearchRank(F('search_vector'), search_query), FloatField()),
+            snippet=SearchHeadline(
+                'plain_text', search_query, config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP,
+                max_fragments=2, max_words=20, min_words=5
+            )
+        )
         
-        logger.info(f"Поиск документов по запросу '{query}', найдено: {found_docs.count()}")
+        logger.info(f"Поиск документов по запросу '{query}'")
         
-        serializer = self.get_serializer(found_docs, many=True)
-        return Response(serializer.data)
+        found_docs = self.restrict_fields(found_docs, DocumentSearchSerializer)
+        return self.get_paginated_action_response(found_docs, ('-rank', '-id'), DocumentSearchSerializer, page_size=20)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Подсказки по заголовкам для строки поиска: id, заголовок и путь.
+        Совпадения по подстроке и похожие написания (pg_trgm) выбираются по
+        триграммному GIN-индексу; повторные запросы кратко кэшируются для пользователя
+        """
+        query = ' '.join(request.query_params.get('q', '').split())
+        if not query:
+            return Response([])
+        
+        try:
+            limit = min(max(int(request.query_params.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT)), 1), AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            return Response({"limit": "Ожидается целое число"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        user = request.user
+        # Запрос хэшируется: пробелы, управляющие символы и длина недопустимы в ключах кэша
+        query_hash = hashlib.sha1(query.lower().encode()).hexdigest()
+        cache_key = f"documents:autocomplete:{user.id}:{limit}:{query_hash}"
+        suggestions = cache.get(cache_key)
+        if suggestions is not None:
+            return Response(suggestions)
+        
+        documents = visible_documents(user).filter(
+            Q(title__icontains=query) | Q(title__trigram_word_similar=query),
+            is_trashed=False
+        ).annotate(
+            similarity=TrigramWordSimilarity(query, 'title')
+        ).only('id', 'title', 'tree_id', 'lft', 'rght').order_by('-similarity', 'title', 'id')[:limit]
+        documents = list(documents)
+        
+        paths = get_ancestor_paths(documents)
+        suggestions = [
+            {
+                'id': document.id,
+                'title': document.title,
+                'path': paths[document.pk]
+            }
+            for document in documents
+        ]
+        
+        cache.set(cache_key, suggestions, AUTOCOMPLETE_CACHE_TIMEOUT)
+        return Response(suggestions)
     
     def create(self, request, *args, **kwargs):
         """
@@ -208,8 +420,30 @@ class DocumentViewSet(viewsets.ModelViewSet):
             # Временно убираем content, чтобы сохранить его отдельно
             del serializer.validated_data['content']
         
-        # Создаем документ с базовыми полями
-        document = Document.objects.create(**serializer.validated_data)
+        parent_document = serializer.validated_data.get('parent')
+        if parent_document is not None and parent_document.is_trashed:
+            return Response(
+                {"parent": "Родительский документ находится в корзине"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            # Вставка в дерево выполняется под блокировкой рабочего пространства;
+            # для документа верхнего уровня блокируется выделение нового tree_id
+            lock_document_trees(parent_document, new_tree=parent_document is None)
+            
+            # Новый вложенный документ встает в конец списка соседей
+            if parent_document is not None:
+                serializer.validated_data['position'] = get_sibling_position(parent_document)
+            
+            # Создаем документ с базовыми полями
+            document = Document.objects.create(**serializer.validated_data)
+            if parent_document is not None:
+                # Права на родителя с include_children действуют и на новый документ
+                refresh_subtree_access(document)
+            
+            # Новый ребенок меняет children и количество потомков у предков
+            invalidate_trees(document.tree_id)
         logger.info(f"Создан документ ID: {document.id}")
         
         # Теперь напрямую сохраняем content
@@ -228,6 +462,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
                     blocks = saved_document.content.get('blocks', [])
                     logger.info(f"Блоков после сохранения: {len(blocks)}")
         
+        # Вычисляем производные поля содержимого и поисковый вектор
+        update_derived_content(document, title_changed=True)
+        
         # Записываем в историю создание документа
         DocumentHistory.objects.create(
             document=document,
@@ -268,6 +505,131 @@ class DocumentViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """
+        Создание (импорт) целой вложенной структуры документов за одну транзакцию.
+        Принимает parent (необязательно) и documents - список {title, content, children}
+        """
+        try:
+            nodes = normalize_document_nodes(request.data.get('documents'), BULK_CREATE_MAX_DOCUMENTS)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not nodes:
+            return Response(
+                {"documents": "Список документов пуст"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        parent = None
+        parent_id = request.data.get('parent')
+        if parent_id:
+            try:
+                parent = self.get_queryset().filter(pk=parent_id).first()
+            except (ValueError, TypeError):
+                parent = None
+            if parent is None:
+                return Response(
+                    {"detail": "Родительский документ не найден"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            if not get_access(request.user, parent, [AccessRight.EDITOR]):
+                return Response(
+                    {"detail": "Недостаточно прав для создания документов в этом разделе"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+        
+        with transaction.atomic():
+            lock_document_trees(parent, new_tree=parent is None)
+            documents = insert_subtrees(nodes, request.user, request.user, parent=parent)
+            if parent is not None:
+                invalidate_trees(parent.tree_id)
+        
+        logger.info(f"Пакетно создано документов: {count_nodes(nodes)} пользователем {request.user.id}")
+        
+        serializer = self.get_serializer(documents, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def duplicate(self, request, pk=None):
+        """
+        Глубокое копирование документа вместе со всеми вложенными документами.
+        Копия встает сразу после оригинала. С параметром stream=true прогресс
+        отдается построчно в формате NDJSON
+        """
+        document = self.get_object()
+        
+        # Копия создается рядом с оригиналом, поэтому нужны права на редактирование родителя
+        if document.parent_id is not None and not get_access(request.user, document.parent, [AccessRight.EDITOR]):
+            return Response(
+                {"detail": "Недостаточно прав для создания документов в этом разделе"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        def run_copy():
+            """
+            Копирует поддерево в одной транзакции, отдавая прогресс после каждой пачки
+            """
+            with transaction.atomic():
+                lock_document_trees(document, new_tree=document.parent_id is None)
+                
+                nodes = copy_subtree_nodes(document)
+                nodes[0]['title'] = f"{document.title} (копия)"[:255]
+                
+                steps = iter_insert_subtrees(nodes, request.user, request.user, after=document)
+                while True:
+                    try:
+                        yield next(steps)
+                    except StopIteration as stop:
+                        copy_document = stop.value[0]
+                        break
+                
+                invalidate_trees(document.tree_id)
+            
+            logger.info(f"Документ {document.id} скопирован в документ {copy_document.id} пользователем {request.user.id}")
+            yield {'done': True, 'document': self.get_serializer(copy_document).data}
+        
+        stream = request.query_params.get('stream', '')
+        if stream.lower() == 'true':
+            async def stream_progress():
+                """
+                Копирование идет в отдельном потоке целиком (транзакция и блокировка дерева
+                не зависят от скорости чтения ответа), события передаются через очередь.
+                Под ASGI синхронный итератор был бы прочитан до конца перед отправкой,
+                поэтому ответ отдается асинхронным итератором. Если клиент отключится,
+                копирование все равно завершится
+                """
+                loop = asyncio.get_running_loop()
+                queue = asyncio.Queue()
+                
+                def produce():
+                    try:
+                        for event in run_copy():
+                            loop.call_soon_threadsafe(queue.put_nowait, event)
+                    except Exception as e:
+                        logger.error(f"Ошибка при копировании документа {document.id}: {str(e)}")
+                        loop.call_soon_threadsafe(queue.put_nowait, {'error': 'Не удалось скопировать документ'})
+                    finally:
+                        # Соединение с БД принадлежит потоку пула, закрываем его
+                        connection.close()
+                        loop.call_soon_threadsafe(queue.put_nowait, None)
+                
+                worker = asyncio.ensure_future(sync_to_async(produce, thread_sensitive=False)())
+                while True:
+                    event = await queue.get()
+                    if event is None:
+                        break
+                    yield json.dumps(event) + '\n'
+                await worker
+            
+            return StreamingHttpResponse(stream_progress(), content_type='application/x-ndjson')
+        
+        result = None
+        for event in run_copy():
+            result = event
+        return Response(result['document'], status=status.HTTP_201_CREATED)
+    
     def update(self, request, *args, **kwargs):
         """
         Переопределяем метод update для правильного сохранения content
@@ -317,16 +679,36 @@ class DocumentViewSet(viewsets.ModelViewSet):
             if 'content' in mutable_data and isinstance(mutable_data['content'], dict):
                 # Экстренное исправление: сохраняем content напрямую, минуя сериализатор
                 instance.content = mutable_data['content']
-                instance.save()
+                instance.save(update_fields=['content', 'updated_at'])
                 logger.info(f"Сохранили content напрямую в модель. Размер: {len(json.dumps(instance.content))}")
             
-            # Сохраняем остальные поля через сериализатор
-            serializer.save()
+            # Сохраняем остальные поля через сериализатор.
+            # Полное сохранение записывает и поля MPTT, поэтому выполняется под блокировкой
+            # дерева с актуальными границами; при смене родителя блокируется и новое дерево
+            with transaction.atomic():
+                new_parent = serializer.validated_data.get('parent')
+                moves_to_top = 'parent' in serializer.validated_data and new_parent is None and instance.parent_id is not None
+                lock_document_trees(instance, new_parent, new_tree=moves_to_top)
+                previous_tree_id = instance.tree_id
+                previous_parent_id = instance.parent_id
+                serializer.save()
+                if instance.parent_id != previous_parent_id:
+                    refresh_subtree_access(instance)
+                
+                # Содержимое влияет на ответ самого документа и родителя (updated_at в children);
+                # заголовок, избранное и родитель видны в path и children других документов дерева
+                invalidate_documents(instance.pk, instance.parent_id, previous_parent_id)
+                if set(serializer.validated_data) - {'content'}:
+                    invalidate_trees(previous_tree_id, instance.tree_id)
             
             # Проверяем результат сохранения
             updated_instance = self.get_object()
             logger.info(f"После сохранения: content тип {type(updated_instance.content)}, пустой: {not bool(updated_instance.content)}")
             
+            # Пересчитываем производные поля, если изменился заголовок или содержимое
+            if 'content' in mutable_data or 'title' in mutable_data:
+                update_derived_content(updated_instance, title_changed=updated_instance.title != previous_title)
+            
             # Определяем тип изменения
             action_type = DocumentHistory.ACTION_EDIT
             
@@ -334,47 +716,221 @@ class DocumentViewSet(viewsets.ModelViewSet):
             if 'title' in mutable_data and previous_title != mutable_data['title'] and previous_content == updated_instance.content:
                 action_type = DocumentHistory.ACTION_TITLE_CHANGE
             
-            # Проверяем, нужно ли записывать это в историю
-            should_record = True
-            
-            # Для обычного редактирования (не изменение заголовка) делаем ограничение по времени
-            if action_type == DocumentHistory.ACTION_EDIT:
-                # Не записываем повторные редактирования от того же пользователя с интервалом менее 5 минут
-                from django.utils import timezone
-                last_edit = DocumentHistory.objects.filter(
-                    document=updated_instance, 
-                    user=request.user,
-                    action_type=DocumentHistory.ACTION_EDIT
-                ).order_by('-created_at').first()
-                
-                if last_edit:
-                    # Проверяем, прошло ли 5 минут с момента последнего редактирования
-                    time_diff = timezone.now() - last_edit.created_at
-                    if time_diff.total_seconds() < 300:  # 5 минут в секундах
-                        should_record = False
-                        logger.info(f"Пропускаем запись редактирования, прошло меньше 5 минут с последнего")
-            
-            # Если нужно записать в историю
-            if should_record:
-                # Записываем в историю изменений
-                DocumentHistory.objects.create(
-                    document=updated_instance,
-                    user=request.user,
-                    action_type=action_type,
-                    changes={
-                        'content': updated_instance.content,
-                        'user_id': request.user.id,
-                        'username': request.user.username,
-                        'action': action_type
-                    }
-                )
+            # Записываем в историю через буфер; повторные редактирования того же
+            # пользователя в течение 5 минут не записываются
+            if record_edit(updated_instance, request.user, action_type, updated_instance.content):
                 logger.info(f"Записано действие {action_type} в историю")
+            else:
+                logger.info("Пропускаем запись редактирования, прошло меньше 5 минут с последнего")
             
             return Response(serializer.data)
         
         logger.error(f"Ошибка валидации: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['post'])
+    def reorder(self, request, pk=None):
+        """
+        Изменение порядка документа среди соседей.
+        Принимает after (ID документа, после которого нужно встать) и/или
+        before (ID документа, перед которым нужно встать)
+        """
+        document = self.get_object()
+        
+        if not get_access(request.user, document, [AccessRight.EDITOR]):
+            return Response(
+                {"detail": "Недостаточно прав для изменения порядка документов"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        if document.parent_id is None:
+            return Response(
+                {"detail": "Документы верхнего уровня нельзя переупорядочивать"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        after_id = request.data.get('after')
+        before_id = request.data.get('before')
+        if not after_id and not before_id:
+            return Response(
+                {"detail": "Укажите after или before"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            lock_document_trees(document)
+            
+            # Соседи ищутся только среди документов с тем же родителем
+            siblings = Document.objects.filter(parent_id=document.parent_id).exclude(pk=document.pk)
+            try:
+                after = siblings.get(pk=after_id) if after_id else None
+                before = siblings.get(pk=before_id) if before_id else None
+                position = get_sibling_position(document.parent, after=after, before=before, exclude=document)
+            except (Document.DoesNotExist, ValueError, TypeError) as e:
+                logger.error(f"Ошибка при изменении порядка документа {document.id}: {str(e)}")
+                return Response(
+                    {"detail": "Некорректные соседние документы"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Меняется только ключ самого документа, соседние записи не переписываются
+            document.position = position
+            document.save()
+            invalidate_trees(document.tree_id)
+        logger.info(f"Документ {document.id} перемещен среди соседей, новый ключ: {position}")
+        
+        serializer = self.get_serializer(document)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """
+        Перемещение документа вместе с поддеревом к другому родителю.
+        Принимает parent (ID нового родителя) и необязательные after/before среди его детей
+        """
+        document = self.get_object()
+        moved = self._move_documents(request, [document])
+        if isinstance(moved, Response):
+            return moved
+        
+        serializer = self.get_serializer(moved[0])
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_move(self, request):
+        """
+        Пакетное перемещение документов к одному родителю за одну транзакцию.
+        Принимает ids (список ID документов), parent и необязательные after/before
+        """
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response(
+                {"detail": "Поле ids должно быть непустым списком"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            documents = list(self.get_queryset().filter(pk__in=ids).order_by('tree_id', 'lft'))
+        except (ValueError, TypeError):
+            return Response(
+                {"detail": "Некорректные ID документов"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(documents) != len(set(map(str, ids))):
+            return Response(
+                {"detail": "Некоторые документы не найдены"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Порядок перемещаемых документов сохраняем таким, как его передал клиент
+        order = {str(document_id): index for index, document_id in enumerate(ids)}
+        documents.sort(key=lambda document: order[str(document.id)])
+        
+        moved = self._move_documents(request, documents)
+        if isinstance(moved, Response):
+            return moved
+        
+        serializer = self.get_serializer(moved, many=True)
+        return Response(serializer.data)
+    
+    def _move_documents(self, request, documents):
+        """
+        Общая часть перемещения: проверка прав и циклов, вычисление ключей порядка
+        и изменение дерева под блокировкой. Возвращает перемещенные документы или Response с ошибкой
+        """
+        parent_id = request.data.get('parent')
+        if not parent_id:
+            return Response(
+                {"parent": "Это поле обязательно"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            target = self.get_queryset().filter(pk=parent_id).first()
+        except (ValueError, TypeError):
+            target = None
+        if target is None:
+            return Response(
+                {"detail": "Родительский документ не найден"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Права на цель и все перемещаемые документы проверяются одним запросом
+        editable = editable_documents(request.user, [target.pk] + [document.pk for document in documents])
+        for document in [target] + documents:
+            if document.pk not in editable:
+                return Response(
+                    {"detail": f"Недостаточно прав для изменения документа {document.id}"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+        
+        after_id = request.data.get('after')
+        before_id = request.data.get('before')
+        moving_ids = [document.pk for document in documents]
+        
+        with transaction.atomic():
+            lock_document_trees(target, *documents)
+            previous_tree_ids = [document.tree_id for document in documents]
+            
+            # Документ нельзя переместить внутрь собственного поддерева
+            for document in documents:
+                if target.is_descendant_of(document, include_self=True):
+                    return Response(
+                        {"detail": f"Документ {document.id} нельзя переместить внутрь самого себя"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            
+            # Потомки других перемещаемых документов переедут вместе с предком
+            documents = [
+                document for document in documents
+                if not any(document.is_descendant_of(other) for other in documents if other is not document)
+            ]
+            
+            siblings = Document.objects.filter(parent=target).exclude(pk__in=moving_ids)
+            try:
+                after = siblings.get(pk=after_id) if after_id else None
+                before = siblings.get(pk=before_id) if before_id else None
+                positions = get_sibling_positions(
+                    target, len(documents), after=after, before=before, exclude_ids=moving_ids
+                )
+            except (Document.DoesNotExist, ValueError, TypeError) as e:
+                logger.error(f"Ошибка при вычислении позиции для перемещения: {str(e)}")
+                return Response(
+                    {"detail": "Некорректные соседние документы"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            same_tree = all(document.tree_id == target.tree_id for document in documents)
+            if len(documents) > 1 and same_tree:
+                # Внутри одного дерева откладываем пересчет границ и перестраиваем дерево один раз
+                with Document.objects.delay_mptt_updates():
+                    for document, position in zip(documents, positions):
+                        document.parent = target
+                        document.position = position
+                        document.save()
+            else:
+                # Один документ или перенос между деревьями: по одному сдвигу lft/rght на документ.
+                # Предыдущие перемещения сдвигают границы, поэтому перечитываем их перед каждым
+                for document, position in zip(documents, positions):
+                    document.refresh_from_db(fields=TREE_FIELDS)
+                    document.parent = target
+                    document.position = position
+                    document.save()
+            
+            # Перенесенные поддеревья теряют права прежних предков и получают права новых
+            for document in documents:
+                document.refresh_from_db(fields=TREE_FIELDS)
+                refresh_subtree_access(document)
+            
+            target.refresh_from_db(fields=TREE_FIELDS)
+            invalidate_trees(target.tree_id, *previous_tree_ids)
+        
+        for document in documents:
+            document.refresh_from_db()
+        
+        logger.info(f"Документы {moving_ids} перемещены в документ {target.id} пользователем {request.user.id}")
+        return documents
+    
     @action(detail=True, methods=['post'])
     def share(self, request, pk=None):
         """
@@ -429,6 +985,8 @@ class DocumentViewSet(viewsets.ModelViewSet):
         serializer = AccessRightSerializer(data=mutable_data, context={'view': self})
         if serializer.is_valid():
             access_right = serializer.save(document=document)
+            sync_access_right(access_right)
+            invalidate_documents(document.pk)
             
             # Импортируем модель Notification
             from users.models import Notification
@@ -466,6 +1024,74 @@ class DocumentViewSet(viewsets.ModelViewSet):
         logger.error(f"Ошибка валидации при предоставлении доступа: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def destroy(self, request, *args, **kwargs):
+        """
+        Перемещение документа в корзину вместе с поддеревом.
+        Поддерево скрывается одним UPDATE по границам MPTT, окончательное удаление
+        пачками выполняет команда purge_trash
+        """
+        document = self.get_object()
+        
+        if not get_access(request.user, document, [AccessRight.EDITOR]):
+            return Response(
+                {"detail": "Недостаточно прав для удаления документа"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        with transaction.atomic():
+            lock_document_trees(document)
+            count = trash_subtree(document)
+            invalidate_trees(document.tree_id)
+        
+        logger.info(f"Документ {document.id} перемещен в корзину пользователем {request.user.id}, документов в поддереве: {count}")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['get'])
+    def trash(self, request):
+        """
+        Получение списка документов пользователя в корзине
+        """
+        trashed_docs = trash_roots().filter(owner=request.user).select_related('owner').order_by('-trashed_at')
+        
+        serializer = self.get_serializer(trashed_docs, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def restore(self, request, pk=None):
+        """
+        Восстановление документа из корзины вместе с поддеревом, удаленным одновременно с ним
+        """
+        document = self.get_object()
+        
+        if not document.is_trashed:
+            return Response(
+                {"detail": "Документ не находится в корзине"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not get_access(request.user, document, [AccessRight.EDITOR]):
+            return Response(
+                {"detail": "Недостаточно прав для восстановления документа"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        with transaction.atomic():
+            lock_document_trees(document)
+            
+            if document.get_ancestors().filter(is_trashed=True).exists():
+                return Response(
+                    {"detail": "Сначала восстановите родительский документ"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            count = restore_subtree(document)
+            invalidate_trees(document.tree_id)
+        
+        logger.info(f"Документ {document.id} восстановлен из корзины пользователем {request.user.id}, документов: {count}")
+        
+        serializer = self.get_serializer(document)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['get'])
     def access_rights(self, request, pk=None):
         """
@@ -493,360 +1119,252 @@ class DocumentViewSet(viewsets.ModelViewSet):
         user = request.user
         
         # Документы, к которым у пользователя есть доступ через права доступа, но владельцем которых он не является
-        shared_documents = Document.objects.filter(
-            access_rights__user=user
-        ).exclude(
-            owner=user
-        ).select_related('owner').distinct()
+        shared_docs = shared_documents(user).filter(is_trashed=False).select_related('owner')
         
-        serializer = self.get_serializer(shared_documents, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_action_response(self.restrict_fields(shared_docs), ('title', 'id'))
+    
+    @action(detail=True, methods=['get'])
+    def tree(self, request, pk=None):
+        """
+        Получение поддерева документа одним запросом, без содержимого.
+        Параметр depth задает глубину, более глубокие уровни клиент подгружает отдельно
+        """
+        document = self.get_cached_object()
+        
+        try:
+            depth = int(request.query_params.get('depth', TREE_DEFAULT_DEPTH))
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "Параметр depth должен быть целым числом"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        depth = max(0, min(depth, TREE_MAX_DEPTH))
+        
+        # Все узлы поддерева до нужного уровня в порядке обхода дерева (по lft)
+        nodes = document.get_descendants(include_self=True).filter(
+            level__lte=document.level + depth,
+            is_trashed=False
+        ).only(
+            'id', 'title', 'parent', 'is_favorite', 'is_root',
+            'lft', 'rght', 'level', 'tree_id'
+        ).order_by('lft')
+        
+        def build_response():
+            serializer = DocumentTreeSerializer(nodes, many=True)
+            return Response({
+                'root': document.id,
+                'depth': depth,
+                'nodes': serializer.data
+            })
+        
+        # has_children узлов последнего уровня зависит от следующего уровня
+        state = fingerprint(document.get_descendants(include_self=True).filter(
+            level__lte=document.level + depth + 1,
+            is_trashed=False
+        ))
+        return conditional_response(request, state, build_response)
     
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
         """
-        Получение истории изменений документа
+        Получение истории изменений документа: краткая лента без версий содержимого,
+        содержимое отдельной версии отдает history_entry
         """
-        document = self.get_object()
+        document = self.get_cached_object()
+        
+        # Сериализуем страницу результатов, новые записи первыми
+        return self.get_paginated_action_response(
+            summary_queryset(document), ('-created_at', '-id'), DocumentHistorySerializer
+        )
+    
+    @action(detail=True, methods=['get'], url_path=r'history/(?P<entry_id>\d+)')
+    def history_entry(self, request, pk=None, entry_id=None):
+        """
+        Запись истории вместе с содержимым документа в ее версии.
+        Версия не меняется, но ответ содержит заголовок документа и данные пользователя,
+        поэтому ETag строится из записи, версий документа и имени и email пользователя
+        """
+        document = self.get_cached_object()
+        
+        entries = DocumentHistory.objects.filter(document_id=document.pk, pk=entry_id)
+        author = entries.values_list('user__username', 'user__email').first()
+        if author is None:
+            raise Http404
+        
+        def build_response():
+            entry = with_summary(entries.select_related('user', 'document').only(
+                'id', 'document', 'user', 'action_type', 'created_at', 'changes',
+                'user__username', 'user__email', 'document__title'
+            )).get()
+            return Response(DocumentHistoryVersionSerializer(entry).data)
+        
+        state = {'entry': int(entry_id), 'versions': get_versions(document), 'user': author}
+        return conditional_response(request, state, build_response)
+    
+    @action(detail=True, methods=['get'], url_path='history/diff')
+    def history_diff(self, request, pk=None):
+        """
+        Сравнение двух версий документа по блокам (параметры from и to - ID записей истории).
+        Содержимое версий восстанавливается на сервере, клиент получает только изменения
+        """
+        document = self.get_cached_object()
+        
+        try:
+            from_id, to_id = int(request.query_params['from']), int(request.query_params['to'])
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "Параметры from и to должны быть ID записей истории"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Получаем историю изменений документа
-        history = DocumentHistory.objects.filter(document=document).order_by('-created_at')
+        versions = DocumentHistory.objects.filter(CONTENT_CHANGES, document_id=document.pk)
+        if versions.filter(pk__in={from_id, to_id}).count() != len({from_id, to_id}):
+            raise Http404
         
-        # Сериализуем результаты
-        serializer = DocumentHistorySerializer(history, many=True)
+        def load_content(entry_id):
+            return get_version_content(versions.only('id', 'document_id', 'changes').get(pk=entry_id))
         
-        return Response(serializer.data)
+        def build_response():
+            try:
+                data = get_versions_diff(document.pk, from_id, to_id, load_content)
+            except DocumentHistory.DoesNotExist as e:
+                logger.error(f"Ошибка при сравнении версий документа {document.pk}: {str(e)}")
+                raise Http404
+            return Response({'from': from_id, 'to': to_id, **data})
+        
+        return conditional_response(request, {'diff': [from_id, to_id]}, build_response)
     
-    def retrieve(self, request, *args, **kwargs):
+    @action(detail=True, methods=['get'])
+    def activity(self, request, pk=None):
         """
-        Получение документа по ID с записью действия просмотра
+        Общая лента истории документа и всех его вложенных документов, новые записи первыми.
+        В ленту попадают только документы, которые пользователь может открыть. Фильтры: action_type и user (значения через запятую)
         """
-        # Стандартное получение объекта
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
+        document = self.get_cached_object()
+        
+        action_types = [value for value in request.query_params.get('action_type', '').split(',') if value]
+        allowed = {value for value, _ in DocumentHistory.ACTION_CHOICES}
+        unknown = [value for value in action_types if value not in allowed]
+        if unknown:
+            return Response(
+                {"action_type": f"Допустимые значения: {', '.join(sorted(allowed))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Записываем в историю просмотр документа
         try:
-            # Не записываем повторные просмотры от того же пользователя с интервалом менее 30 минут
-            last_view = DocumentHistory.objects.filter(
-                document=instance, 
-                user=request.user,
-                action_type=DocumentHistory.ACTION_VIEW
-            ).order_by('-created_at').first()
-            
-            should_record = True
-            if last_view:
-                # Проверяем, прошло ли достаточно времени с момента последнего просмотра
-                from django.utils import timezone
-                time_diff = timezone.now() - last_view.created_at
-                if time_diff.total_seconds() < 1800:  # 30 минут в секундах
-                    should_record = False
-            
-            if should_record:
-                DocumentHistory.objects.create(
-                    document=instance,
-                    user=request.user,
-                    action_type=DocumentHistory.ACTION_VIEW,
-                    changes={
-                        'user_id': request.user.id,
-                        'username': request.user.username
-                    }
-                )
+            users = [int(value) for value in request.query_params.get('user', '').split(',') if value]
+        except ValueError:
+            return Response({"user": "Ожидаются ID пользователей"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return self.get_paginated_action_response(
+            subtree_activity_queryset(document, request.user, action_types, users),
+            ('-created_at', '-id'),
+            DocumentHistorySerializer
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Получение документа по ID с записью действия просмотра.
+        Документ и доступ проверяются по кэшу объектов, а сериализованный ответ берется
+        из общего кэша по версиям документа и дерева; ETag строится из тех же версий
+        """
+        node = self.get_cached_object()
+        versions = get_versions(node)
+        cache_key = detail_cache_key(node, versions, request)
+        
+        def build_response():
+            data = get_cached_detail(cache_key)
+            if data is None:
+                instance = self.get_object()
+                data = self.get_serializer(instance).data
+                set_cached_detail(cache_key, data)
+            return Response(data)
+        
+        # Просмотр ставится в буфер истории, чтение документа не пишет в БД
+        try:
+            record_view(node, request.user)
         except Exception as e:
             # В случае ошибки просто логируем и продолжаем
             logger.error(f"Ошибка при записи просмотра документа: {str(e)}")
-            
-        return Response(serializer.data)
+        
+        return conditional_response(request, {'versions': versions}, build_response)
 
     @action(detail=True, methods=['get'])
     def statistics(self, request, pk=None):
         """
         Получение статистических данных о документе
         """
-        document = self.get_object()
+        document = self.get_cached_object()
         user = request.user
         
         # Проверяем, есть ли у пользователя доступ к документу
-        if document.owner != user and not AccessRight.objects.filter(document=document, user=user).exists():
+        if not can_view(user, document):
             return Response({"detail": "У вас нет доступа к этому документу"}, status=status.HTTP_403_FORBIDDEN)
         
         # Логируем ID документа и его структуру
         logger.info(f"Получение статистики для документа ID: {document.id}")
         
-        # Получаем дату создания документа
-        created_at = document.created_at
+        # Статистика зависит от поддерева (содержимое, задачи, структура) и списка прав доступа
+        subtree = subtree_queryset(document).filter(is_trashed=False)
+        access = list(AccessRight.objects.filter(document=document).order_by('user_id').values_list('user_id', 'role'))
+        # Просмотры меняются без изменения документа, поэтому входят в состояние ответа
+        views_count = count_views(document.pk)
         
-        # Получаем количество редакторов
-        editors_count = AccessRight.objects.filter(document=document, role=AccessRight.EDITOR).count()
-        if document.owner != user:  # Владелец также является редактором
-            editors_count += 1
-            
-        # Рекурсивно получаем все вложенные документы
-        def get_nested_documents(doc_id):
-            # Находим прямые дочерние документы
-            children = Document.objects.filter(parent_id=doc_id)
-            result = list(children)
+        def build_response():
+            # Получаем дату создания документа
+            created_at = document.created_at
+        
+            # Получаем количество редакторов
+            editors_count = AccessRight.objects.filter(document=document, role=AccessRight.EDITOR).count()
+            if document.owner_id != user.pk:  # Владелец также является редактором
+                editors_count += 1
             
-            # Рекурсивно обходим дерево
-            for child in children:
-                result.extend(get_nested_documents(child.id))
-                
-            return result
-                
-        nested_docs = get_nested_documents(document.id)
-        nested_docs_count = len(nested_docs)
+            # Вложенные документы и задачи считаются одним агрегатом по границам MPTT
+            # из производных колонок, без разбора содержимого
+            totals = subtree.aggregate(
+                documents=Count('id'),
+                tasks=Sum('tasks_count'),
+                completed=Sum('completed_tasks_count')
+            )
+            nested_docs_count = max(totals['documents'] - 1, 0)
+            total_tasks = totals['tasks'] or 0
+            total_completed_tasks = totals['completed'] or 0
         
-        # Собираем все ID документов для дальнейшей обработки
-        all_doc_ids = [document.id] + [doc.id for doc in nested_docs]
+            # Логируем итоговые результаты
+            logger.info(f"ВСЕГО по всем документам - задач: {total_tasks}, выполнено: {total_completed_tasks}")
         
-        # Прямой анализ JSON для точного подсчета задач
-        def analyze_document_tasks(doc):
-            """Прямой анализ JSON для подсчета всех задач и выполненных задач"""
-            if not doc.content:
-                logger.info(f"Документ {doc.id} не содержит контента")
-                return 0, 0
-            
-            # Преобразуем контент в JSON-строку и в словарь для различных типов анализа
-            try:
-                content_str = json.dumps(doc.content)
-                content_dict = doc.content if isinstance(doc.content, dict) else {}
-            except Exception as e:
-                logger.error(f"Ошибка преобразования content в JSON: {e}")
-                return 0, 0
-            
-            logger.info(f"Анализ документа {doc.id}, размер JSON: {len(content_str)} байт")
-            
-            # Получаем блоки документа
-            blocks = content_dict.get('blocks', [])
-            logger.info(f"Документ содержит {len(blocks)} блоков")
-            
-            # Прямой перебор блоков для точного подсчета
-            total_tasks = 0
-            completed_tasks = 0
+            # Находим самого активного пользователя (по количеству закрытых задач)
+            most_active_user = None
+        
+            # Проверяем, что есть история изменений с закрытием задач
+            task_completions = DocumentHistory.objects.filter(
+                document_id__in=subtree.values('id'),
+                action_type=DocumentHistory.ACTION_TASK_COMPLETE
+            ).values('user__username').annotate(count=Count('id')).order_by('-count').first()
+        
+            if task_completions:
+                most_active_user = task_completions['user__username']
+        
+            # Вычисляем процент выполнения задач
+            completion_percentage = 0
+            if total_tasks > 0:
+                completion_percentage = round((total_completed_tasks / total_tasks) * 100)
             
-            for block in blocks:
-                block_type = block.get('type')
-                block_id = block.get('id', 'no-id')
-                
-                # Для блоков типа 'list' со стилем 'checklist'
-                if block_type == 'list':
-                    data = block.get('data', {})
-                    style = data.get('style')
-                    
-                    if style == 'checklist':
-                        items = data.get('items', [])
-                        item_count = len(items)
-                        logger.info(f"Найден list-checklist с {item_count} элементами, ID={block_id}")
-                        
-                        # Учитываем каждый элемент как отдельную задачу
-                        for i, item in enumerate(items):
-                            total_tasks += 1
-                            item_str = json.dumps(item) if isinstance(item, dict) else str(item)
-                            
-                            # Проверяем, отмечен ли элемент
-                            checked = False
-                            # Проверяем все возможные варианты хранения статуса "выполнено"
-                            if isinstance(item, dict):
-                                # Прямая проверка на checked = true/True
-                                if item.get('checked') is True or str(item.get('checked')).lower() == 'true':
-                                    checked = True
-                                    logger.info(f"Элемент {i} отмечен через checked=true: {item}")
-                                # Проверка на наличие HTML-класса в content или text
-                                elif isinstance(item.get('content'), str) and 'cdx-list__checkbox--checked' in item.get('content'):
-                                    checked = True
-                                    logger.info(f"Элемент {i} отмечен через HTML класс в content: {item.get('content')[:50]}...")
-                                elif isinstance(item.get('text'), str) and 'cdx-list__checkbox--checked' in item.get('text'):
-                                    checked = True
-                                    logger.info(f"Элемент {i} отмечен через HTML класс в text: {item.get('text')[:50]}...")
-                            # Если item - строка, проверяем наличие HTML-класса
-                            elif isinstance(item, str) and 'cdx-list__checkbox--checked' in item:
-                                checked = True
-                                logger.info(f"Элемент {i} отмечен через HTML класс в строке: {item[:50]}...")
-                            
-                            # Общая проверка на любые признаки в JSON-строке
-                            if not checked and ('"checked":true' in item_str or '"checked": true' in item_str or 
-                                                'cdx-list__checkbox--checked' in item_str or 'checked="true"' in item_str):
-                                checked = True
-                                logger.info(f"Элемент {i} отмечен через поиск в JSON-строке: {item_str[:50]}...")
-                                
-                            if checked:
-                                completed_tasks += 1
-                                logger.info(f"Элемент {i} УЧТЕН как выполненный")
-                            else:
-                                logger.info(f"Элемент {i} НЕ отмечен как выполненный: {item_str[:50]}...")
-                
-                # Для блоков типа 'checklist'
-                elif block_type == 'checklist':
-                    data = block.get('data', {})
-                    items = data.get('items', [])
-                    item_count = len(items)
-                    logger.info(f"Найден checklist с {item_count} элементами, ID={block_id}")
-                    
-                    # Учитываем каждый элемент как отдельную задачу
-                    for i, item in enumerate(items):
-                        total_tasks += 1
-                        item_str = json.dumps(item) if isinstance(item, dict) else str(item)
-                        
-                        # Проверяем, отмечен ли элемент
-                        checked = False
-                        # Проверяем все возможные варианты хранения статуса "выполнено"
-                        if isinstance(item, dict):
-                            # Прямая проверка на checked = true/True
-                            if item.get('checked') is True or str(item.get('checked')).lower() == 'true':
-                                checked = True
-                                logger.info(f"Элемент чеклиста {i} отмечен через checked=true: {item}")
-                            # Проверка на наличие HTML-класса в content или text
-                            elif isinstance(item.get('content'), str) and 'cdx-list__checkbox--checked' in item.get('content'):
-                                checked = True
-                                logger.info(f"Элемент чеклиста {i} отмечен через HTML класс в content")
-                            elif isinstance(item.get('text'), str) and 'cdx-list__checkbox--checked' in item.get('text'):
-                                checked = True
-                                logger.info(f"Элемент чеклиста {i} отмечен через HTML класс в text")
-                        # Если item - строка, проверяем наличие HTML-класса
-                        elif isinstance(item, str) and 'cdx-list__checkbox--checked' in item:
-                            checked = True
-                            logger.info(f"Элемент чеклиста {i} отмечен через HTML класс в строке")
-                        
-                        # Общая проверка на любые признаки в JSON-строке
-                        if not checked and ('"checked":true' in item_str or '"checked": true' in item_str or 
-                                            'cdx-list__checkbox--checked' in item_str or 'checked="true"' in item_str):
-                            checked = True
-                            logger.info(f"Элемент чеклиста {i} отмечен через поиск в JSON-строке")
-                            
-                        if checked:
-                            completed_tasks += 1
-                            logger.info(f"Элемент чеклиста {i} УЧТЕН как выполненный")
-                        else:
-                            logger.info(f"Элемент чеклиста {i} НЕ отмечен как выполненный: {item_str[:50]}...")
-                
-                # Для блоков типа 'task'
-                elif block_type == 'task':
-                    total_tasks += 1
-                    data = block.get('data', {})
-                    is_completed = data.get('is_completed', False)
-                    
-                    if is_completed:
-                        completed_tasks += 1
-            
-            # Если прямой перебор блоков не дал результатов, используем анализ через регулярные выражения
-            if total_tasks == 0:
-                logger.info("Прямой перебор блоков не нашел задач, пробуем регулярные выражения")
-                
-                # Подсчет маркеров выполненных задач
-                
-                # Ищем блоки типа "list" со стилем "checklist"
-                list_checklist_pattern = r'"type"\s*:\s*"list".*?"style"\s*:\s*"checklist"'
-                list_checklists = re.findall(list_checklist_pattern, content_str)
-                list_checklists_count = len(list_checklists)
-                
-                # Ищем блоки типа "checklist"
-                checklist_pattern = r'"type"\s*:\s*"checklist"'
-                checklists = re.findall(checklist_pattern, content_str)
-                checklists_count = len(checklists)
-                
-                # Ищем массивы items в JSON
-                items_pattern = r'"items"\s*:\s*\[(.*?)\]'
-                items_matches = re.findall(items_pattern, content_str, re.DOTALL)
-                
-                # Подсчитываем элементы в найденных массивах items
-                items_count = 0
-                checked_items = 0
-                
-                for items_match in items_matches:
-                    # Подсчет элементов (объектов или строк)
-                    items = re.findall(r'({[^{}]*}|"[^"]*")', items_match)
-                    items_count += len(items)
-                    
-                    # Подсчет отмеченных элементов
-                    for i, item in enumerate(items):
-                        item_is_checked = False
-                        # Проверяем все возможные варианты отметки в JSON
-                        if '"checked":true' in item or '"checked": true' in item:
-                            item_is_checked = True
-                            logger.info(f"Regex: элемент {i} отмечен через checked:true")
-                        elif 'cdx-list__checkbox--checked' in item:
-                            item_is_checked = True
-                            logger.info(f"Regex: элемент {i} отмечен через CSS класс")
-                        elif 'checked="true"' in item:
-                            item_is_checked = True
-                            logger.info(f"Regex: элемент {i} отмечен через HTML атрибут")
-                        elif '"checked":"true"' in item:
-                            item_is_checked = True
-                            logger.info(f"Regex: элемент {i} отмечен через checked:'true' (строка)")
-                        
-                        if item_is_checked:
-                            checked_items += 1
-                            logger.info(f"Regex: элемент {i} УЧТЕН как выполненный")
-                        else:
-                            logger.info(f"Regex: элемент {i} НЕ отмечен как выполненный: {item[:50]}...")
-                
-                # Финальный подсчет задач через регулярные выражения
-                if items_count > 0:
-                    total_tasks = items_count
-                    completed_tasks = checked_items
-                else:
-                    # Используем оценку, если не смогли найти элементы
-                    total_tasks = (list_checklists_count + checklists_count) * 3
-                    
-                    # Ищем элементы с "checked":true для оценки выполненных задач
-                    pattern_checked = r'"checked"\s*:\s*true'
-                    checked_items = re.findall(pattern_checked, content_str)
-                    completed_tasks = len(checked_items)
-            
-            # В любом случае, корректируем результаты
-            if total_tasks < completed_tasks:
-                total_tasks = completed_tasks
-            
-            logger.info(f"ИТОГ по документу {doc.id}: всего задач: {total_tasks}, выполнено: {completed_tasks}")
-            return total_tasks, completed_tasks
-        
-        # Подсчитываем задачи во всех документах
-        total_tasks = 0
-        total_completed_tasks = 0
-        
-        # Текущий документ
-        doc_tasks, doc_completed = analyze_document_tasks(document)
-        total_tasks += doc_tasks
-        total_completed_tasks += doc_completed
-        
-        # Вложенные документы
-        for doc in nested_docs:
-            doc_tasks, doc_completed = analyze_document_tasks(doc)
-            total_tasks += doc_tasks
-            total_completed_tasks += doc_completed
-        
-        # Логируем итоговые результаты
-        logger.info(f"ВСЕГО по всем документам - задач: {total_tasks}, выполнено: {total_completed_tasks}")
-        
-        # Находим самого активного пользователя (по количеству закрытых задач)
-        most_active_user = None
-        
-        # Проверяем, что есть история изменений с закрытием задач
-        task_completions = DocumentHistory.objects.filter(
-            document_id__in=all_doc_ids,
-            action_type=DocumentHistory.ACTION_TASK_COMPLETE
-        ).values('user__username').annotate(count=Count('id')).order_by('-count').first()
-        
-        if task_completions:
-            most_active_user = task_completions['user__username']
-        
-        # Вычисляем процент выполнения задач
-        completion_percentage = 0
-        if total_tasks > 0:
-            completion_percentage = round((total_completed_tasks / total_tasks) * 100)
-            
-        # Формируем ответ
-        result = {
-            'created_at': created_at.isoformat(),
-            'editor_count': editors_count,
-            'nested_documents_count': nested_docs_count,
-            'tasks_count': total_tasks,
-            'completed_tasks_count': total_completed_tasks,
-            'completion_percentage': completion_percentage,
-            'most_active_user': most_active_user
-        }
-        
-        return Response(result)
+            # Формируем ответ
+            result = {
+                'created_at': created_at.isoformat(),
+                'editor_count': editors_count,
+                'nested_documents_count': nested_docs_count,
+                'tasks_count': total_tasks,
+                'completed_tasks_count': total_completed_tasks,
+                'completion_percentage': completion_percentage,
+                'most_active_user': most_active_user,
+                'views_count': views_count
+            }
+        
+            return Response(result)
+        
+        return conditional_response(request, fingerprint(subtree), build_response, access, views_count)
 
     @action(detail=True, methods=['post'])
     def toggle_task(self, request, pk=None):
@@ -934,7 +1452,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
                             nested_content = nested_doc.content
                             if update_task(nested_content.get('blocks', [])):
                                 nested_doc.content = nested_content
-                                nested_doc.save()
+                                nested_doc.save(update_fields=['content', 'updated_at'])
+                                update_derived_content(nested_doc)
+                                invalidate_documents(nested_doc.pk, nested_doc.parent_id)
                                 return True
                         except Document.DoesNotExist:
                             pass
@@ -943,7 +1463,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
             update_task(document_data.get('blocks', []))
             
             if updated:
-                document.save()
+                document.save(update_fields=['content', 'updated_at'])
+                update_derived_content(document)
+                invalidate_documents(document.pk, document.parent_id)
                 
                 # Запись в историю документа
                 action_type = DocumentHistory.ACTION_TASK_COMPLETE if is_completed else DocumentHistory.ACTION_EDIT
@@ -985,6 +1507,16 @@ class AccessRightViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return AccessRight.objects.filter(document__owner=user)
     
+    def perform_create(self, serializer):
+        access_right = serializer.save()
+        sync_access_right(access_right)
+        invalidate_documents(access_right.document_id)
+    
+    def perform_update(self, serializer):
+        access_right = serializer.save()
+        sync_access_right(access_right)
+        invalidate_documents(access_right.document_id)
+    
     def destroy(self, request, *args, **kwargs):
         """
         Отзыв доступа к документу
@@ -1006,6 +1538,7 @@ class AccessRightViewSet(viewsets.ModelViewSet):
         
         # Удаляем доступ
         access_right.delete()
+        invalidate_documents(document.id)
         
         # Записываем в историю отзыв доступа
         DocumentHistory.objects.create(
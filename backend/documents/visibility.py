@@ -0,0 +1,54 @@
+"""
+Запросы видимости документов и задач.
+
+Условие "владелец ИЛИ есть право" через JOIN к правам размножает строки и требует
+DISTINCT: PostgreSQL строит хэш-соединение по всей таблице и сортировку для
+устранения дублей. Здесь каждая ветка доступа - отдельный индексный поиск:
+собственные документы по индексу owner, права - коррелированным EXISTS по индексу
+(user, document) таблицы прав. Дубликатов не возникает, DISTINCT не нужен,
+и сортировка с LIMIT (курсорная пагинация) может идти по индексу.
+"""
+from django.db.models import Q, Exists, OuterRef
+from .models import Document, AccessRight, EffectiveAccess
+
+
+def has_access(user, document_field='pk'):
+    """
+    EXISTS: у пользователя есть действующее право (в том числе унаследованное)
+    на документ, на который указывает поле document_field внешнего запроса
+    """
+    return Exists(EffectiveAccess.objects.filter(user_id=user.pk, document_id=OuterRef(document_field)))
+
+
+def has_direct_access(user, document_field='pk'):
+    """
+    EXISTS: пользователю выдано право непосредственно на этот документ
+    """
+    return Exists(AccessRight.objects.filter(user_id=user.pk, document_id=OuterRef(document_field)))
+
+
+def visible_documents(user, queryset=None):
+    """
+    Документы, которые пользователь может открыть: собственные и доступные по правам
+    """
+    if queryset is None:
+        queryset = Document.objects.all()
+    return queryset.filter(Q(owner_id=user.pk) | has_access(user))
+
+
+def shared_documents(user, queryset=None):
+    """
+    Чужие документы, которыми с пользователем поделились напрямую
+    """
+    if queryset is None:
+        queryset = Document.objects.all()
+    return queryset.filter(has_direct_access(user)).exclude(owner_id=user.pk)
+
+
+def visible_tasks(user, queryset):
+    """
+    Задачи в доступных пользователю документах и назначенные на него
+    """
+    return queryset.filter(
+        Q(document__owner_id=user.pk) | has_access(user, 'document_id') | Q(assigned_to_id=user.pk)
+    )
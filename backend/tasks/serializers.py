@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import Task, TaskComment
 from django.contrib.auth import get_user_model
 from documents.models import Document
+from documents.access import can_view
 
 User = get_user_model()
 
@@ -37,7 +38,7 @@ class TaskSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         
         # Проверяем, что пользователь владеет документом или имеет к нему доступ
-        if value.owner != user and not value.access_rights.filter(user=user).exists():
+        if not can_view(user, value):
             raise serializers.ValidationError("У вас нет доступа к этому документу")
         
         return value
@@ -54,7 +55,7 @@ class TaskSerializer(serializers.ModelSerializer):
             try:
                 document = Document.objects.get(id=document_id)
                 # Проверяем, что пользователь владеет документом или имеет к нему доступ
-                if document.owner != value and not document.access_rights.filter(user=value).exists():
+                if not can_view(value, document):
                     raise serializers.ValidationError("Назначаемый пользователь не имеет доступа к этому документу")
             except Document.DoesNotExist:
                 pass  # Валидация document_id выполняется отдельно
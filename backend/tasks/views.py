@@ -2,7 +2,7 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from documents.visibility import visible_tasks
 from .models import Task, TaskComment
 from .serializers import TaskSerializer, TaskCommentSerializer
 
@@ -22,17 +22,9 @@ class TaskViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         
-        # Задачи в документах, которыми владеет пользователь
-        own_tasks = Q(document__owner=user)
-        
-        # Задачи в документах, к которым у пользователя есть доступ
-        access_tasks = Q(document__access_rights__user=user)
-        
-        # Задачи, назначенные на пользователя
-        assigned_tasks = Q(assigned_to=user)
-        
-        # Объединяем и исключаем дубликаты
-        return Task.objects.filter(own_tasks | access_tasks | assigned_tasks).distinct()
+        # Ветки доступа проверяются через EXISTS, дубликатов нет и DISTINCT не нужен;
+        # задачи документов из корзины не показываем
+        return visible_tasks(user, Task.objects.filter(document__is_trashed=False))
     
     def perform_create(self, serializer):
         """
@@ -22,6 +22,9 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+        ]
     
     def __str__(self):
         return f"Уведомление для {self.recipient.username} от {self.sender.username} ({self.type})"
@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import UserSerializer, RegisterSerializer, VerifyEmailSerializer, UserUpdateSerializer, NotificationSerializer, EmailVerifiedTokenObtainPairSerializer
 from .models import Notification
+from documents.pagination import KeysetPagination
 from .email_service import send_verification_email
 import random
 import string
@@ -119,9 +120,13 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         Получение списка уведомлений текущего пользователя
         """
-        notifications = Notification.objects.filter(recipient=request.user)
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data)
+        notifications = Notification.objects.filter(recipient=request.user).select_related('sender')
+        
+        # Новые уведомления первыми, страницами по курсору
+        paginator = KeysetPagination(ordering=('-created_at', '-id'), page_size=20)
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        serializer = NotificationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def mark_as_read(self, request, pk=None):
@@ -3,7 +3,7 @@
 import React, { useEffect, useState } from 'react';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
-import { CalendarDays, Users, FileText, CheckSquare, Activity, Award } from 'lucide-react';
+import { CalendarDays, Users, FileText, CheckSquare, Activity, Award, Eye } from 'lucide-react';
 import api from '@/lib/api';
 import { format } from 'date-fns';
 import { ru } from 'date-fns/locale';
@@ -22,6 +22,7 @@ interface Statistics {
   completed_tasks_count: number;
   completion_percentage: number;
   most_active_user: string | null;
+  views_count: number;
 }
 
 export function DocumentStatistics({ documentId }: DocumentStatisticsProps) {
@@ -128,6 +129,14 @@ export function DocumentStatistics({ documentId }: DocumentStatisticsProps) {
                   <div className="text-2xl font-bold">{statistics.nested_documents_count}</div>
                 </div>
               </div>
+              
+              <div className="flex items-center space-x-2">
+                <Eye className="h-5 w-5 text-muted-foreground" />
+                <div>
+                  <div className="text-sm font-medium">Просмотры</div>
+                  <div className="text-2xl font-bold">{statistics.views_count}</div>
+                </div>
+              </div>
             </div>
             
             {statistics.most_active_user && (
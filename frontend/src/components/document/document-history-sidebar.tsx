@@ -40,7 +40,7 @@ export function DocumentHistorySidebar({ documentId, onClose }: DocumentHistoryS
       try {
         setLoading(true);
         const response = await api.get(`/documents/${documentId}/history/`);
-        setHistory(response.data);
+        setHistory(response.data?.results ?? response.data);
       } catch (err) {
         console.error("Ошибка при загрузке истории:", err);
         setError("Не удалось загрузить историю изменений");
@@ -46,8 +46,10 @@ export function AppSidebar({ className, ...props }: AppSidebarProps) {
     const fetchFavorites = async () => {
       try {
         const response = await api.get("/documents/favorites/");
-        if (Array.isArray(response.data)) {
-          setFavoriteDocuments(response.data);
+        // Список отдается страницами: { next, next_cursor, results }
+        const favorites = response.data?.results ?? response.data;
+        if (Array.isArray(favorites)) {
+          setFavoriteDocuments(favorites);
         } else {
           setFavoriteDocuments([]);
         }
@@ -65,8 +67,9 @@ export function AppSidebar({ className, ...props }: AppSidebarProps) {
     const fetchSharedDocuments = async () => {
       try {
         const response = await api.get("/documents/shared_with_me/");
-        if (Array.isArray(response.data)) {
-          setSharedDocuments(response.data);
+        const shared = response.data?.results ?? response.data;
+        if (Array.isArray(shared)) {
+          setSharedDocuments(shared);
         } else {
           setSharedDocuments([]);
         }
@@ -47,7 +47,7 @@ export function NotificationDropdown() {
       console.log("Запрашиваем уведомления...");
       const response = await api.get('/users/notifications/');
       console.log("Получен ответ с уведомлениями:", response.data);
-      setNotifications(response.data);
+      setNotifications(response.data?.results ?? response.data);
     } catch (error) {
       console.error('Ошибка при загрузке уведомлений:', error);
     } finally {